@@ -0,0 +1,265 @@
+import getopt
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import bulk_engine
+
+# Benchmark of the build over a fixed matrix of configurations, on every engine.
+#
+#   python src/benchmark.py [--engines=solid,cadquery] [--only=name,...] [--out=benchmark_results]
+#                           [--baseline=file] [--threshold=0.1] [--save-baseline]
+#
+# Run from the repository root, like dactyl_manuform.py.  Each configuration is
+# configs/default.json with the overrides below, built in a fresh Python process with the stage
+# cache off, so every run is a cold build of the same model.  For every build the results file
+# (<out>/results.json) has:
+#
+#   seconds       wall time of the whole build process, imports included
+#   stages        seconds per stage, from the build trace (nested stages count in their parent too)
+#   peak_rss_mb   the largest resident size of the build or of any of its worker processes,
+#                 null on Windows
+#   faces         faces of each exported STEP file (cadquery only)
+#
+# The results are compared with the baseline (<out>/baseline.json unless given), if there is
+# one: anything slower or bigger than the baseline by more than the threshold is a regression,
+# and so is any change of face counts, the model itself is not supposed to change.  The exit
+# code is 1 when there are regressions.  --save-baseline makes these results the new baseline.
+#
+# Timings only compare between runs on the same machine, the baseline is not kept in the repository.
+
+matrix = [
+    {
+        "name": "4x5_NOTCH_DEFAULT",
+        "overrides": {"nrows": 4, "ncols": 5, "centerrow_offset": 2.5, "plate_style": "NOTCH", "thumb_style": "DEFAULT"},
+    },
+    {
+        "name": "5x6_HS_NOTCH_TRACKBALL_ORBYL",
+        "overrides": {"nrows": 5, "ncols": 6, "plate_style": "HS_NOTCH", "thumb_style": "TRACKBALL_ORBYL"},
+    },
+    {
+        "name": "6x7_OLED_CLIP",
+        "overrides": {"nrows": 6, "ncols": 7, "oled_mount_type": "CLIP",
+                      "preset": "file:options/trackball_in_wall/6x7.json"},
+    },
+]
+
+engines = ["solid", "cadquery"]
+
+# every build of the benchmark, whatever run_config.json says
+benchmark_settings = {
+    "overrides": "",
+    "stage_cache_size_mb": 0,
+    "build_trace_file": True,
+    "operation_stats_file": False,
+    "show_caps": False,  # keycaps are a preview, not part of the printed model
+}
+
+default_threshold = 0.1
+
+# differences below these are noise, whatever the threshold
+min_seconds = 0.5
+min_rss_mb = 20.0
+
+
+def configuration(entry, engine, out_dir):
+    with open(os.path.join("configs", "default.json"), mode='r') as fid:
+        preset = json.load(fid)
+    config = bulk_engine.variant(bulk_engine.base_config(engine), preset)
+    config = bulk_engine.variant(config, entry["overrides"])
+    config.update(benchmark_settings)
+    config.update({
+        "ENGINE": engine,
+        "config_name": entry["name"],
+        "save_dir": os.path.abspath(os.path.join(out_dir, engine, entry["name"])),
+        "save_name": entry["name"],
+    })
+    return config
+
+
+def _trace_stages(save_dir):
+    # seconds per span name in the build trace, summed over sides and processes
+    stages = {}
+    for name in os.listdir(save_dir):
+        if name.endswith("_TRACE.json"):
+            with open(os.path.join(save_dir, name)) as fid:
+                for event in json.load(fid)["traceEvents"]:
+                    if event["ph"] == "X":
+                        stages[event["name"]] = stages.get(event["name"], 0.0) + event["dur"] / 1e6
+    return stages
+
+
+def _step_faces(save_dir):
+    import cadquery as cq
+    faces = {}
+    for name in sorted(os.listdir(save_dir)):
+        if name.endswith(".step"):
+            shape = cq.importers.importStep(os.path.join(save_dir, name))
+            faces[name] = sum(len(val.Faces()) for val in shape.vals() if isinstance(val, cq.Shape))
+    return faces
+
+
+def _peak_rss_mb():
+    # the largest resident size of this process or any of its finished children: getrusage()
+    # on Unix (ru_maxrss in kilobytes, on macOS in bytes), unknown on Windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024.0
+
+
+def run_one(run_dir):
+    # in the build process: build <run_dir>/config.json, write <run_dir>/result.json
+    with open(os.path.join(run_dir, "config.json"), mode='r') as fid:
+        config = json.load(fid)
+    import dactyl_manuform
+    dactyl_manuform.make_dactyl(config)
+    result = {
+        "stages": _trace_stages(config["save_dir"]),
+        "peak_rss_mb": _peak_rss_mb(),
+        "faces": _step_faces(config["save_dir"]) if config["ENGINE"] == "cadquery" else None,
+    }
+    with open(os.path.join(run_dir, "result.json"), mode='w') as fid:
+        json.dump(result, fid, indent=2)
+
+
+def run_all(entries, engine_names, out_dir):
+    runs = []
+    for engine in engine_names:
+        for entry in entries:
+            config = configuration(entry, engine, out_dir)
+            run_dir = config["save_dir"]
+            os.makedirs(run_dir, exist_ok=True)
+            for name in os.listdir(run_dir):
+                if os.path.isfile(os.path.join(run_dir, name)):
+                    os.remove(os.path.join(run_dir, name))
+            with open(os.path.join(run_dir, "config.json"), mode='w') as fid:
+                json.dump(config, fid, indent=2)
+
+            print("BENCHMARK {} ({})".format(entry["name"], engine))
+            start = time.perf_counter()
+            with open(os.path.join(run_dir, "build.log"), mode='w') as log:
+                exit_code = subprocess.call([sys.executable, os.path.abspath(__file__), "--run=" + run_dir],
+                                            stdout=log, stderr=subprocess.STDOUT)
+            run = {"name": entry["name"], "engine": engine, "exit_code": exit_code,
+                   "seconds": time.perf_counter() - start, "stages": {}, "peak_rss_mb": None, "faces": None}
+            if exit_code == 0:
+                with open(os.path.join(run_dir, "result.json"), mode='r') as fid:
+                    run.update(json.load(fid))
+            print("    {:.1f}s, {}".format(run["seconds"], "ok" if exit_code == 0 else
+                                           "FAILED, see " + os.path.join(run_dir, "build.log")))
+            runs.append(run)
+
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {"node": platform.node(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "runs": runs,
+    }
+
+
+def _slower(new, old, floor, threshold):
+    return new is not None and old is not None and new - old > max(floor, old * threshold)
+
+
+def compare(results, baseline, threshold):
+    # printed table of every build against the baseline; returns the number of regressions
+    old_runs = {(run["name"], run["engine"]): run for run in baseline["runs"]}
+    regressions = 0
+    print()
+    print("BENCHMARK against the baseline of {}, threshold {:.0%}".format(baseline["created"], threshold))
+    print("{:>9} {:>9} {:>8}  {:<36} {}".format("seconds", "baseline", "change", "build", "regressions"))
+    for run in results["runs"]:
+        old = old_runs.get((run["name"], run["engine"]))
+        label = "{} ({})".format(run["name"], run["engine"])
+        if old is None:
+            print("{:>9.1f} {:>9} {:>8}  {:<36} not in the baseline".format(run["seconds"], "", "", label))
+            continue
+
+        found = []
+        if run["exit_code"] != 0:
+            found.append("build failed")
+        if _slower(run["seconds"], old["seconds"], min_seconds, threshold):
+            found.append("total time")
+        for stage, seconds in sorted(run["stages"].items()):
+            if _slower(seconds, old["stages"].get(stage), min_seconds, threshold):
+                found.append("{} {:.1f}s -> {:.1f}s".format(stage, old["stages"][stage], seconds))
+        if _slower(run["peak_rss_mb"], old["peak_rss_mb"], min_rss_mb, threshold):
+            found.append("peak RSS {:.0f}MB -> {:.0f}MB".format(old["peak_rss_mb"], run["peak_rss_mb"]))
+        if run["exit_code"] == 0 and old["faces"] is not None and run["faces"] != old["faces"]:
+            found.append("face counts changed")
+        regressions += len(found)
+
+        change = (run["seconds"] - old["seconds"]) / old["seconds"]
+        print("{:>9.1f} {:>9.1f} {:>+8.1%}  {:<36} {}".format(
+            run["seconds"], old["seconds"], change, label, "; ".join(found) if found else "none"))
+
+    print("{} regressions".format(regressions))
+    return regressions
+
+
+def report(results):
+    print()
+    print("{:>9} {:>9} {:>8}  {}".format("seconds", "peak MB", "faces", "build"))
+    for run in results["runs"]:
+        faces = sum(run["faces"].values()) if run["faces"] else None
+        print("{:>9.1f} {:>9} {:>8}  {} ({}){}".format(
+            run["seconds"], "" if run["peak_rss_mb"] is None else "{:.0f}".format(run["peak_rss_mb"]),
+            "" if faces is None else faces, run["name"], run["engine"], "" if run["exit_code"] == 0 else "  FAILED"))
+
+
+def main():
+    opts, args = getopt.getopt(sys.argv[1:], "", ["engines=", "only=", "out=", "baseline=", "threshold=",
+                                                  "save-baseline", "run="])
+    engine_names = engines
+    only = None
+    out_dir = "benchmark_results"
+    baseline_file = None
+    threshold = default_threshold
+    save_baseline = False
+    for opt, arg in opts:
+        if opt == "--run":
+            return run_one(arg)
+        elif opt == "--engines":
+            engine_names = arg.split(",")
+        elif opt == "--only":
+            only = arg.split(",")
+        elif opt == "--out":
+            out_dir = arg
+        elif opt == "--baseline":
+            baseline_file = arg
+        elif opt == "--threshold":
+            threshold = float(arg)
+        elif opt == "--save-baseline":
+            save_baseline = True
+
+    entries = [entry for entry in matrix if only is None or entry["name"] in only]
+    if not entries:
+        print("No benchmark configuration named {}, choose from {}".format(
+            ", ".join(only), ", ".join(entry["name"] for entry in matrix)))
+        sys.exit(2)
+    baseline_file = baseline_file or os.path.join(out_dir, "baseline.json")
+
+    results = run_all(entries, engine_names, out_dir)
+    with open(os.path.join(out_dir, "results.json"), mode='w') as fid:
+        json.dump(results, fid, indent=2)
+    report(results)
+
+    regressions = 0
+    if os.path.isfile(baseline_file):
+        with open(baseline_file, mode='r') as fid:
+            regressions = compare(results, json.load(fid), threshold)
+    if save_baseline:
+        with open(baseline_file, mode='w') as fid:
+            json.dump(results, fid, indent=2)
+        print("SAVED BASELINE TO {}".format(baseline_file))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import getopt
+import os
+import sys
+import time
+
+import dactyl_manuform
+import helpers_cadquery
+from json_loader import load_json
+
+# Times union([key_holes(), connectors()]) for each union strategy over a range of board sizes.
+#
+#   python src/benchmark_union.py [--sizes=4x5,5x6,6x7] [--strategies=fold,tree,fuse] [--serial]
+#
+# Run from the repository root, like dactyl_manuform.py.
+
+sizes = [(4, 5), (4, 6), (5, 6), (5, 7), (6, 6), (6, 7)]
+strategies = ["fold", "tree", "fuse"]
+
+
+def time_key_plate(env):
+    start = time.perf_counter()
+    shape = env["built"](env["union"]([env["key_holes"](), env["connectors"]()]))
+    elapsed = time.perf_counter() - start
+    return elapsed, shape.val().Volume()
+
+
+def benchmark(rows, cols, strategy, parallel=True):
+    # every strategy starts from empty caches, or the ones run later would reuse the solids
+    # the first one built
+    helpers_cadquery.clear_primitive_cache()
+    helpers_cadquery.clear_part_cache()
+    data = load_json(os.path.join("src", "run_config.json"))
+    data.update({
+        "ENGINE": "cadquery",
+        "overrides": "",
+        "nrows": rows,
+        "ncols": cols,
+        "union_strategy": strategy,
+        "boolean_parallel": parallel,
+    })
+    return dactyl_manuform.make_dactyl(data, task=time_key_plate)
+
+
+def main():
+    global sizes, strategies
+    parallel = True
+    opts, args = getopt.getopt(sys.argv[1:], "", ["sizes=", "strategies=", "serial"])
+    for opt, arg in opts:
+        if opt == "--sizes":
+            sizes = [tuple(int(n) for n in size.split("x")) for size in arg.split(",")]
+        elif opt == "--strategies":
+            strategies = arg.split(",")
+        elif opt == "--serial":
+            parallel = False
+
+    results = {}
+    for rows, cols in sizes:
+        for strategy in strategies:
+            results[(rows, cols, strategy)] = benchmark(rows, cols, strategy, parallel)
+
+    print()
+    print("{:>6}  ".format("board") + "".join("{:>10}".format(strategy) for strategy in strategies) + "   speedup")
+    for rows, cols in sizes:
+        times = [results[(rows, cols, strategy)][0] for strategy in strategies]
+        print("{:>6}  ".format("{}x{}".format(rows, cols))
+              + "".join("{:>9.2f}s".format(t) for t in times)
+              + "{:>9.1f}x".format(times[0] / min(times)))
+        volumes = [results[(rows, cols, strategy)][1] for strategy in strategies]
+        if max(volumes) - min(volumes) > 1e-3 * max(volumes):
+            print("        volumes differ: " + ", ".join("{:.1f}".format(v) for v in volumes))
+
+
+if __name__ == '__main__':
+    main()
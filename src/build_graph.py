@@ -0,0 +1,155 @@
+import ast
+import getopt
+import os
+import sys
+
+import dactyl_manuform
+import generate_configuration as cfg
+import stage_cache
+from json_loader import load_json
+
+# Which config parameters each build stage depends on.
+#
+#   python src/build_graph.py --list                 every stage with its parameters
+#   python src/build_graph.py oled_mount_type nrows  stages invalidated by changing these
+#
+# Run from the repository root, like dactyl_manuform.py.
+#
+# The stages and their inputs are those make_dactyl() declares in stages(), the ones its
+# cached() calls build.  The parameters a stage reads are found by walking the code reachable
+# from its functions and inputs (stage_cache.referenced_names) and by following the settings
+# that make_dactyl() derives from the config back to the parameters they are computed from.
+
+
+def declared_stages(env):
+    # stage -> (the functions and objects it is built from on either side, the stages whose output it consumes)
+    right, left = env["stages"]("right"), env["stages"]("left")
+    # a stage reads the parameters of its own code, those of upstream stages come in through invalidated()
+    return {name: ([build, *args, left[name][0], *left[name][1]], upstream)
+            for name, (build, args, _, upstream) in right.items()}
+
+
+def _loaded_names(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+
+
+def _stored_names(node):
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)}
+
+
+def derived_settings(source=None):
+    # name -> names it is computed from, for every variable assigned in make_dactyl()'s own body
+    # (nested functions excluded).  Names in the conditions around an assignment count too.
+    if source is None:
+        # not dactyl_manuform.__file__: make_dactyl() copies the engine helpers, __file__ included, into its globals
+        source = dactyl_manuform.make_dactyl.__code__.co_filename
+    with open(source, mode='r') as fid:
+        tree = ast.parse(fid.read())
+    make_dactyl = next(node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == "make_dactyl")
+
+    inputs = {}
+
+    def visit(statements, conditions):
+        for statement in statements:
+            if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue
+            if isinstance(statement, (ast.If, ast.While)):
+                inner = conditions | _loaded_names(statement.test)
+                visit(statement.body, inner)
+                visit(statement.orelse, inner)
+            elif isinstance(statement, ast.For):
+                inner = conditions | _loaded_names(statement.iter)
+                for name in _stored_names(statement.target):
+                    inputs.setdefault(name, set()).update(inner)
+                visit(statement.body, inner)
+                visit(statement.orelse, inner)
+            elif isinstance(statement, (ast.With, ast.Try)):
+                visit(statement.body, conditions)
+                for handler in getattr(statement, "handlers", []):
+                    visit(handler.body, conditions)
+                visit(getattr(statement, "orelse", []), conditions)
+                visit(getattr(statement, "finalbody", []), conditions)
+            elif isinstance(statement, (ast.Assign, ast.AugAssign, ast.AnnAssign)) and statement.value is not None:
+                targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+                for target in targets:
+                    for name in _stored_names(target):
+                        inputs.setdefault(name, set()).update(_loaded_names(statement.value) | conditions)
+                        if isinstance(statement, ast.AugAssign):
+                            inputs[name].add(name)
+
+    visit(make_dactyl.body, set())
+    return inputs
+
+
+def parameters_of(names, config_keys, derived):
+    # config parameters behind a set of names, following derived settings back to the config
+    found = set()
+    pending = list(names)
+    visited = set()
+    while pending:
+        name = pending.pop()
+        if name in visited:
+            continue
+        visited.add(name)
+        if name in config_keys:
+            found.add(name)
+        pending.extend(derived.get(name, ()))
+    return found
+
+
+def stage_parameters(env, config_keys):
+    # stage -> (parameters, upstream stages)
+    stage_cache.configure(None, 0, [*cfg.build_settings, *dactyl_manuform.stage_plumbing])
+    derived = derived_settings()
+    graph = {}
+    for stage, (sources, upstream) in declared_stages(env).items():
+        graph[stage] = (parameters_of(stage_cache.referenced_names(*sources), config_keys, derived), upstream)
+    return graph
+
+
+def load_graph(data=None):
+    # stage -> (parameters, upstream stages), for the given merged config (run_config.json by default)
+    if data is None:
+        data = load_json(os.path.join("src", "run_config.json"))
+        data.update({"overrides": ""})
+    config_keys = set(cfg.shape_config) | set(data)
+    return dactyl_manuform.make_dactyl(data, task=lambda env: stage_parameters(env, config_keys))
+
+
+def invalidated(graph, changed):
+    # stages reading any of the changed parameters, and every stage downstream of those
+    stale = {stage for stage, (parameters, _) in graph.items() if parameters & set(changed)}
+    grew = True
+    while grew:
+        grew = False
+        for stage, (_, upstream) in graph.items():
+            if stage not in stale and stale.intersection(upstream):
+                stale.add(stage)
+                grew = True
+    return [stage for stage in graph if stage in stale]
+
+
+def main():
+    opts, args = getopt.getopt(sys.argv[1:], "", ["list"])
+    graph = load_graph()
+
+    print()
+    if ("--list", "") in opts or not args:
+        for stage, (parameters, upstream) in graph.items():
+            print("{} ({} parameters{})".format(
+                stage, len(parameters), ", after " + ", ".join(upstream) if upstream else ""))
+            print("    " + ", ".join(sorted(parameters)))
+        return
+
+    unknown = [name for name in args if name not in cfg.shape_config]
+    if unknown:
+        print("Not config parameters: " + ", ".join(unknown))
+    stale = invalidated(graph, args)
+    print("Changing {} invalidates: {}".format(", ".join(args), ", ".join(stale) if stale else "nothing"))
+    for stage in graph:
+        if stage not in stale:
+            print("    unchanged: " + stage)
+
+
+if __name__ == '__main__':
+    main()
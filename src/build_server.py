@@ -0,0 +1,291 @@
+import getopt
+import glob
+import http.server
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+import bulk_engine
+
+# A long running build server that keeps the CAD kernel and the generator imported.
+#
+#   python src/build_server.py [--port=8765] [--jobs=N]          start the server
+#   python src/build_server.py [--port=8765] --submit=file.json   build a config and wait for it
+#
+# Run from the repository root, like dactyl_manuform.py.  The server listens on localhost only.
+#
+#   POST /jobs            body: a JSON object of config values over run_config.json; returns {"id": ...}
+#   GET  /jobs            every job's status
+#   GET  /jobs/<id>       one job: status, exit code, seconds and the files it wrote
+#   GET  /jobs/<id>/log   the job's output, streamed until it finishes
+#
+# Jobs are started from a fork server (multiprocessing's "forkserver" start method), a process of
+# its own with none of the server's HTTP and scheduler threads, which warms up once on starting
+# (see build_server_warm_up.py): warm_up() runs make_dactyl() without building, which imports
+# the engine helpers and loads the clusters, then imports cadquery, OCP and scipy (otherwise
+# loaded on first use) and every part in src/parts.  Each job is then a process forked from the
+# fork server, so it starts with all of that in memory and with no state left over from earlier
+# jobs.  The stage cache and part BREP cache on disk are shared by every job.
+
+default_port = 8765
+
+log_dir = os.path.abspath(os.path.join(".", "build_server_logs"))
+
+
+class Job:
+    def __init__(self, job_id, config):
+        self.id = job_id
+        self.config = config
+        self.status = "queued"
+        self.exit_code = None
+        self.started = None
+        self.seconds = None
+        self.artifacts = []
+        self.log = os.path.join(log_dir, "job_{}.log".format(job_id))
+        self.process = None
+
+    def describe(self):
+        return {
+            "id": self.id,
+            "label": bulk_engine.config_label(self.config),
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "seconds": self.seconds,
+            "artifacts": self.artifacts,
+        }
+
+    def finished(self):
+        return self.status in ["done", "failed"]
+
+
+def _run_job(config, log):
+    # in the forked child: all output, including that of its own worker processes, goes to the log
+    with open(log, "ab", buffering=0) as fid:
+        os.dup2(fid.fileno(), 1)
+        os.dup2(fid.fileno(), 2)
+    sys.stdout = os.fdopen(1, "w", buffering=1)
+    sys.stderr = os.fdopen(2, "w", buffering=1)
+    import dactyl_manuform
+    dactyl_manuform.make_dactyl(config)
+
+
+def _preload_cadquery():
+    # whatever the configured engine, so cadquery jobs find everything loaded too
+    import helpers_cadquery
+    import scipy.spatial
+    helpers_cadquery.cq.Workplane
+    parts = os.path.join("src", "parts")
+    for name in sorted(os.listdir(parts)):
+        if name.lower().endswith(".step"):
+            try:
+                helpers_cadquery.import_file(os.path.abspath(os.path.join(parts, name[:-len(".step")])))
+            except Exception as e:
+                print("UNABLE TO PRELOAD PART {}: {}".format(name, e))
+
+
+def warm_up():
+    import dactyl_manuform
+    start = time.perf_counter()
+    if importlib.util.find_spec("cadquery") is not None:
+        dactyl_manuform.make_dactyl(bulk_engine.base_config(), task=lambda env: None)
+        _preload_cadquery()
+    else:
+        print("WARM UP: cadquery is not installed, only solid jobs can run")
+        dactyl_manuform.make_dactyl(bulk_engine.base_config("solid"), task=lambda env: None)
+    print("WARM UP: {:.1f}s".format(time.perf_counter() - start), flush=True)
+
+
+def _artifacts(log, since):
+    # files written since the job started in the directories it exported to
+    directories = set()
+    with open(log, mode='r', errors='replace') as fid:
+        for line in fid:
+            for marker in ["EXPORTING TO ", "EXPORTING STL TO "]:
+                if line.startswith(marker):
+                    directories.add(os.path.dirname(os.path.abspath(line[len(marker):].strip())))
+    files = []
+    for directory in sorted(directories):
+        for name in glob.glob(os.path.join(directory, "*")):
+            if os.path.isfile(name) and os.path.getmtime(name) >= since:
+                files.append(name)
+    return sorted(files)
+
+
+class BuildServer:
+    def __init__(self, jobs=1):
+        self.jobs = jobs
+        self.queue = []
+        self.all_jobs = {}
+        self.lock = threading.Condition()
+        self.context = multiprocessing.get_context("forkserver")
+        self.context.set_forkserver_preload(["__main__", "build_server_warm_up"])
+
+    def start_fork_server(self):
+        # now, before any thread is started, rather than with the first job.  The fork server is
+        # a new interpreter, it finds the modules next to this one through PYTHONPATH.
+        from multiprocessing import forkserver
+        paths = [os.path.dirname(os.path.abspath(__file__)), os.environ.get("PYTHONPATH")]
+        os.environ["PYTHONPATH"] = os.pathsep.join(path for path in paths if path)
+        forkserver.ensure_running()
+
+    def submit(self, overrides):
+        with self.lock:
+            job = Job(len(self.all_jobs) + 1, bulk_engine.variant(bulk_engine.base_config(), overrides))
+            self.all_jobs[job.id] = job
+            self.queue.append(job)
+            self.lock.notify_all()
+        return job
+
+    def schedule(self):
+        # starts queued jobs, at most self.jobs at a time, and collects finished ones
+        os.makedirs(log_dir, exist_ok=True)
+        while True:
+            with self.lock:
+                running = [job for job in self.all_jobs.values() if job.status == "running"]
+                for job in running:
+                    if not job.process.is_alive():
+                        job.process.join()
+                        job.exit_code = job.process.exitcode
+                        job.seconds = time.time() - job.started
+                        job.artifacts = _artifacts(job.log, job.started)
+                        job.status = "done" if job.exit_code == 0 else "failed"
+                        print("FINISHED job {}: {}".format(job.id, job.status))
+                        self.lock.notify_all()
+                while self.queue and len([job for job in self.all_jobs.values() if job.status == "running"]) < self.jobs:
+                    job = self.queue.pop(0)
+                    open(job.log, "wb").close()
+                    job.started = time.time()
+                    job.process = self.context.Process(target=_run_job, args=(job.config, job.log))
+                    job.process.start()
+                    job.status = "running"
+                    print("STARTED job {}: {}".format(job.id, bulk_engine.config_label(job.config)))
+                self.lock.wait(0.5)
+
+    def wait(self, job, timeout):
+        with self.lock:
+            return self.lock.wait_for(job.finished, timeout)
+
+
+def _handler(server):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def send_json(self, data, status=200):
+            body = json.dumps(data, indent=2).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def job(self, job_id):
+            try:
+                return server.all_jobs.get(int(job_id))
+            except ValueError:
+                return None
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/jobs":
+                return self.send_json({"error": "not found"}, 404)
+            try:
+                overrides = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except ValueError as e:
+                return self.send_json({"error": "invalid JSON: {}".format(e)}, 400)
+            if not isinstance(overrides, dict):
+                return self.send_json({"error": "expected a JSON object of config values"}, 400)
+            self.send_json(server.submit(overrides).describe(), 202)
+
+        def do_GET(self):
+            parts = [part for part in self.path.split("/") if part]
+            if parts == ["jobs"]:
+                return self.send_json([job.describe() for job in server.all_jobs.values()])
+            if len(parts) in [2, 3] and parts[0] == "jobs" and self.job(parts[1]) is not None:
+                job = self.job(parts[1])
+                if len(parts) == 2:
+                    return self.send_json(job.describe())
+                if parts[2] == "log":
+                    return self.stream_log(job)
+            self.send_json({"error": "not found"}, 404)
+
+        def stream_log(self, job):
+            # plain HTTP/1.0 body, ended by closing the connection once the job is over
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.end_headers()
+            while job.status == "queued":
+                server.wait(job, 0.5)
+            with open(job.log, "rb") as fid:
+                while True:
+                    done = job.finished()
+                    data = fid.read()
+                    if data:
+                        self.wfile.write(data)
+                        self.wfile.flush()
+                    if done:
+                        break
+                    server.wait(job, 0.5)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port, jobs):
+    server = BuildServer(jobs)
+    server.start_fork_server()
+    threading.Thread(target=server.schedule, daemon=True).start()
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", port), _handler(server))
+    print("BUILD SERVER listening on http://127.0.0.1:{}/jobs, {} job(s) at a time".format(port, jobs))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def submit(port, overrides_file):
+    # Client: submit a config, print its output as it builds, then the files it wrote.
+    with open(overrides_file, mode='r') as fid:
+        overrides = json.load(fid)
+    url = "http://127.0.0.1:{}/jobs".format(port)
+    request = urllib.request.Request(url, data=json.dumps(overrides).encode(), method="POST",
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        job = json.load(response)
+    print("SUBMITTED job {}: {}".format(job["id"], job["label"]))
+
+    with urllib.request.urlopen("{}/{}/log".format(url, job["id"])) as response:
+        for line in response:
+            sys.stdout.write(line.decode(errors="replace"))
+    with urllib.request.urlopen("{}/{}".format(url, job["id"])) as response:
+        job = json.load(response)
+
+    print("JOB {} {} in {:.1f}s".format(job["id"], job["status"].upper(), job["seconds"]))
+    for artifact in job["artifacts"]:
+        print("    " + artifact)
+    return 0 if job["status"] == "done" else 1
+
+
+def main():
+    opts, args = getopt.getopt(sys.argv[1:], "", ["port=", "jobs=", "submit="])
+    port = default_port
+    jobs = 1
+    overrides_file = None
+    for opt, arg in opts:
+        if opt == "--port":
+            port = int(arg)
+        elif opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--submit":
+            overrides_file = arg
+
+    if overrides_file is not None:
+        sys.exit(submit(port, overrides_file))
+    serve(port, jobs)
+
+
+if __name__ == '__main__':
+    main()
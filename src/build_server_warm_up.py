@@ -0,0 +1,5 @@
+import build_server
+
+# Imported by the fork server build_server.py starts its jobs from: the warm-up runs once, in
+# that process, and every job is forked from it afterwards.
+build_server.warm_up()
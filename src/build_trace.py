@@ -0,0 +1,107 @@
+import functools
+import json
+import os
+import shutil
+import threading
+import time
+
+# Timing trace of a build in Chrome trace event format, for chrome://tracing or ui.perfetto.dev.
+#
+# Stages are recorded as complete ("X") events.  Every process of the build, the side
+# processes and the part workers included, appends its events to its own file next to the
+# trace as each one ends; finish() in the process that started the trace merges them.
+
+_path = None
+_parts = None
+_owner = None
+
+
+def start(path):
+    global _path, _parts, _owner
+    _path = path
+    _parts = path + ".parts"
+    _owner = os.getpid()
+    shutil.rmtree(_parts, ignore_errors=True)
+    os.makedirs(_parts, exist_ok=True)
+
+
+def enabled():
+    return _parts is not None
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def _record(event):
+    event.update(pid=os.getpid(), tid=threading.get_ident())
+    with open(os.path.join(_parts, "{}.jsonl".format(os.getpid())), "a") as fid:
+        fid.write(json.dumps(event) + "\n")
+
+
+class span:
+    # with span("key_holes", side="right"): ...
+    def __init__(self, name, **args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now()
+        return self
+
+    def __exit__(self, *exc):
+        if _parts is not None:
+            _record({"name": self.name, "ph": "X", "ts": self.start, "dur": _now() - self.start, "args": self.args})
+        return False
+
+
+def traced(func, name=None):
+    # func wrapped in a span named after it, with its plain keyword arguments (side=...) as arguments
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _parts is None:
+            return func(*args, **kwargs)
+        with span(name, **{k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool))}):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def trace_methods(obj, names):
+    # replace obj's methods with traced ones, named <class>.<method>
+    for name in names:
+        method = getattr(obj, name, None)
+        if method is not None:
+            setattr(obj, name, traced(method, "{}.{}".format(type(obj).__name__, name)))
+    return obj
+
+
+def finish():
+    # merge every process's events into the trace file; only the process that started it does
+    global _path, _parts, _owner
+    if _parts is None or os.getpid() != _owner:
+        return None
+
+    events = []
+    pids = set()
+    for name in sorted(os.listdir(_parts)):
+        with open(os.path.join(_parts, name)) as fid:
+            for line in fid:
+                event = json.loads(line)
+                events.append(event)
+                pids.add(event["pid"])
+    for pid in sorted(pids):
+        label = "build" if pid == _owner else "worker {}".format(pid)
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": label}})
+        events.append({"name": "process_sort_index", "ph": "M", "pid": pid, "args": {"sort_index": 0 if pid == _owner else pid}})
+
+    with open(_path, "w") as fid:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fid)
+    shutil.rmtree(_parts, ignore_errors=True)
+
+    path = _path
+    _path = _parts = _owner = None
+    print("WROTE BUILD TRACE TO {}".format(path))
+    return path
@@ -1,7 +1,8 @@
+import getopt
 import os
 import json
 import sys
-import dactyl_manuform
+import bulk_engine
 
 json_template = """
 {
@@ -29,47 +30,11 @@ clusters = [
     "TRACKBALL_WILD", "TRACKBALL_THREE", "TRACKBALL_ORBYL"
 ]
 
-gen_dir = sys.argv[1]
-
-try:
-    print(gen_dir)
-except NameError:
-    print("Must provide target directory for generating bulk models")
-    sys.exit(-1)
-
-out_file = os.path.join(gen_dir, "bulk_config")
-
 engine = "cadquery"
 default = "DEFAULT"
 trackball = "TRACKBALL_WILD"
 hotswap = "HS_NOTCH"
 normal = "NOTCH"
-run_config = os.path.join(r"src", 'run_config.json')
-
-
-def write_file(file_path, data):
-    if os.path.exists(file_path):
-        os.remove(file_path)
-    f = open(file_path, "a")
-    f.write(json.dumps(data, indent=2))
-    f.close()
-
-
-def set_overrides(override):
-    with open(run_config, mode='r') as fid:
-        data = json.load(fid)
-
-    previous_overrides = data["overrides"]
-    data["overrides"] = override
-    write_file(run_config, data)
-    return previous_overrides
-
-
-previous_overrides = set_overrides(out_file)
-
-def finished():
-    set_overrides(previous_overrides)
-    sys.exit(0)
 
 
 override_list = [
@@ -91,7 +56,7 @@ override_list = [
     # },
 ]
 
-def write_config(top_dir, overrides):
+def make_config(base, top_dir, overrides):
     config = json.loads(json_template)
     for key in overrides:
         config[key] = overrides[key]
@@ -110,9 +75,8 @@ def write_config(top_dir, overrides):
         row_name = "all"
     name = str(rows) + "x" + str(cols) + "_" + plate + "_" + thumb + "_rows_" + row_name
     config["save_dir"] = os.path.join(gen_dir, top_dir)
-    config["overrides"] = out_file
     config["save_name"] = name
-    write_file(out_file + '.json', config)
+    return bulk_engine.variant(base, config)
 
 # def write_config(rows, cols, engine, thumb1, plate, last_rows):
 #     config = json.loads(json_template)
@@ -134,14 +98,39 @@ def write_config(top_dir, overrides):
 #     write_file(out_file + '.json', config)
 
 
-for v in override_list:
-    name = v["name"]
-    it = v["iterate"]
-    for config in it:
-        write_config(name, config)
-        dactyl_manuform.make_dactyl()
+def main():
+    global gen_dir
+    opts, args = getopt.getopt(sys.argv[1:], "", ["jobs=", "fork"])
+    jobs = 0
+    fork = False
+    for opt, arg in opts:
+        if opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--fork":
+            fork = True
+
+    if len(args) < 1:
+        print("Must provide target directory for generating bulk models")
+        print("    python src/bulk_build.py [--jobs=N] [--fork] target_dir")
+        sys.exit(-1)
+
+    gen_dir = args[0]
+    print(gen_dir)
 
+    base = bulk_engine.base_config()
+    configurations = []
+    for v in override_list:
+        name = v["name"]
+        it = v["iterate"]
+        for config in it:
+            configurations.append(make_config(base, name, config))
 
-finished()
+    if fork:
+        results = bulk_engine.build_forked(configurations, jobs)
+    else:
+        results = bulk_engine.build_all(configurations, jobs)
+    sys.exit(1 if bulk_engine.report(results) else 0)
 
 
+if __name__ == '__main__':
+    main()
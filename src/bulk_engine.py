@@ -0,0 +1,204 @@
+import copy
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+
+from json_loader import merge_config
+
+# Builds many configurations at once, one worker process per configuration.
+#
+# Each worker is handed its complete, merged configuration and calls
+# dactyl_manuform.make_dactyl() with it, so nothing is written to run_config.json and no
+# module has to be reloaded between builds: every build starts from a fresh process.
+# At most `jobs` builds run at a time.
+#
+# Variants often share stages: every thumb style of a 5x6 NOTCH board has the same key holes
+# and connectors.  Before building, each configuration is planned (stage keys only, nothing
+# built) and every stage that two or more variants would build is built once, by itself, into
+# the shared stage cache.  The variant builds then load it from there.
+
+
+def base_config(engine=None):
+    # run_config.json as it stands, without its override file, as the starting point for variants
+    with open(os.path.join("src", "run_config.json"), mode='r') as fid:
+        base = json.load(fid)
+    base["overrides"] = ""
+    if engine is not None:
+        base["ENGINE"] = engine
+    return base
+
+
+def variant(base, overrides):
+    # a full configuration: base with overrides applied, "file:" values resolved as load_json() does
+    return merge_config(overrides, copy.deepcopy(base))
+
+
+def config_label(config):
+    for key in ["save_name", "config_name"]:
+        if config.get(key) not in ["", None]:
+            return "{} ({})".format(config[key], config.get("ENGINE"))
+    return "{}x{} ({})".format(config.get("nrows"), config.get("ncols"), config.get("ENGINE"))
+
+
+def _build(config):
+    import dactyl_manuform
+    dactyl_manuform.make_dactyl(config)
+
+
+def _plan_stages(env):
+    plan = {}
+    for side in env["built_sides"]():
+        for name in env["independent_stages"]():
+            key = env["declared_stage_key"](name, side=side)
+            if key is not None and not env["stage_cached"](key):
+                plan[key] = (side, name)
+    return plan
+
+
+def _plan(config):
+    # stage key -> (side, stage) for the stages this configuration would have to build
+    import dactyl_manuform
+    return dactyl_manuform.make_dactyl(config, task=_plan_stages)
+
+
+def _build_stage(config, side, name):
+    import dactyl_manuform
+
+    def build(env):
+        env["cached_stage"](name, side=side)
+
+    dactyl_manuform.make_dactyl(config, task=build)
+
+
+def _prefix_keys(env):
+    # stages have keys only while they are kept on disk or in memory
+    env["keep_stages"](True)
+    keys = tuple(env["declared_stage_key"]("model_side_prefix", side=side)
+                 for side in env["built_sides"]())
+    env["keep_stages"](False)
+    return keys
+
+
+def _build_prefixes(env):
+    # returns the engine's keep_stages(), to let go of them again
+    env["keep_stages"](True)
+    for side in env["built_sides"]():
+        env["cached_stage"]("model_side_prefix", side=side)
+    return env["keep_stages"]
+
+
+def _run_processes(jobs, tasks, context=multiprocessing):
+    # tasks: (label, target, args); returns (label, exit code, seconds) for each, in order
+    results = [None] * len(tasks)
+    pending = list(enumerate(tasks))
+    running = {}
+    while pending or running:
+        while pending and len(running) < jobs:
+            index, (label, target, args) = pending.pop(0)
+            print("BUILDING {} of {}: {}".format(index + 1, len(tasks), label))
+            process = context.Process(target=target, args=args)
+            process.start()
+            running[process.sentinel] = (index, label, process, time.perf_counter())
+
+        for sentinel in multiprocessing.connection.wait(list(running)):
+            index, label, process, start = running.pop(sentinel)
+            process.join()
+            results[index] = (label, process.exitcode, time.perf_counter() - start)
+            print("FINISHED {}: {}".format(
+                label, "ok" if process.exitcode == 0 else "exit code {}".format(process.exitcode)))
+
+    return results
+
+
+def build_shared_stages(configurations, jobs):
+    # Build each stage needed by more than one configuration once, into the stage cache.
+    with multiprocessing.Pool(min(jobs, len(configurations)), maxtasksperchild=1) as pool:
+        plans = pool.map(_plan, configurations, chunksize=1)
+
+    users = {}
+    for index, plan in enumerate(plans):
+        for key in plan:
+            users.setdefault(key, []).append(index)
+    shared = [(key, indices) for key, indices in users.items() if len(indices) > 1]
+    print("SHARED STAGES: {} of {} stages are needed by more than one of {} builds".format(
+        len(shared), len(users), len(configurations)))
+    if not shared:
+        return []
+
+    tasks = []
+    for key, indices in shared:
+        side, name = plans[indices[0]][key]
+        label = "shared {} {} for {} builds".format(name, side, len(indices))
+        tasks.append((label, _build_stage, (configurations[indices[0]], side, name)))
+    return _run_processes(jobs, tasks)
+
+
+def build_all(configurations, jobs=0, target=_build, share=True):
+    # Returns (label, exit code, seconds) for each configuration, in order.
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1:
+        # the jobs already use every core, builds inside them run one part at a time
+        configurations = [dict(config, concurrent_sides=False, build_processes=1) for config in configurations]
+
+    if share and len(configurations) > 1:
+        build_shared_stages(configurations, jobs)
+
+    return _run_processes(jobs, [(config_label(config), target, (config,)) for config in configurations])
+
+
+def build_forked(configurations, jobs=0):
+    # Variants whose model_side() prefix (key plate, thumb, walls) is the same are built from
+    # one copy of it: this process builds the prefix and keeps it in memory, then forks a child
+    # per variant that only does the rest.  Variants sharing their prefix with no other are
+    # built by build_all().
+    import dactyl_manuform
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        print("FORKED BUILDS NEED fork(), building every variant from scratch")
+        return build_all(configurations, jobs)
+
+    groups = {}
+    for index, config in enumerate(configurations):
+        keys = dactyl_manuform.make_dactyl(config, task=_prefix_keys)
+        if None in keys:
+            keys = ("unshared", index)
+        groups.setdefault(keys, []).append(index)
+
+    shared = [indices for indices in groups.values() if len(indices) > 1]
+    alone = [indices[0] for indices in groups.values() if len(indices) == 1]
+    print("FORKED BUILDS: {} of {} builds share {} prefixes".format(
+        sum(len(indices) for indices in shared), len(configurations), len(shared)))
+
+    results = [None] * len(configurations)
+    if alone:
+        for index, result in zip(alone, build_all([configurations[index] for index in alone], jobs, share=False)):
+            results[index] = result
+
+    jobs = jobs or os.cpu_count() or 1
+    fork = multiprocessing.get_context("fork")
+    for indices in shared:
+        # The prefix is built here with the configuration's own build settings, they are not part
+        # of its key, except parallel booleans: OCC's thread pool does not survive fork(), and a
+        # variant forked after this process started it can deadlock.
+        prefix_config = dict(configurations[indices[0]], boolean_parallel=False)
+        keep_stages = dactyl_manuform.make_dactyl(prefix_config, task=_build_prefixes)
+        variants = [configurations[index] for index in indices]
+        if jobs > 1:
+            variants = [dict(config, concurrent_sides=False, build_processes=1) for config in variants]
+        tasks = [(config_label(config), _build, (config,)) for config in variants]
+        for index, result in zip(indices, _run_processes(jobs, tasks, fork)):
+            results[index] = result
+        keep_stages(False)
+
+    return results
+
+
+def report(results):
+    failed = [result for result in results if result[1] != 0]
+    print()
+    for label, exitcode, seconds in results:
+        print("{:>9.1f}s  {}  {}".format(seconds, "ok    " if exitcode == 0 else "FAILED", label))
+    print("{} of {} builds failed".format(len(failed), len(results)))
+    return len(failed)
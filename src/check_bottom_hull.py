@@ -0,0 +1,76 @@
+import os
+import sys
+
+import numpy as np
+
+import dactyl_manuform
+import helpers_cadquery
+from json_loader import load_json
+
+# Regression check for the single-pass helpers_cadquery.bottom_hull: builds the back and
+# front wall braces of a board with it and with the previous looping implementation and
+# compares their volumes.
+#
+#   python src/check_bottom_hull.py
+#
+# Run from the repository root, like dactyl_manuform.py.
+
+tolerance = 1e-6
+
+
+def legacy_bottom_hull(p, height=0.001):
+    # helpers_cadquery.bottom_hull before it was rewritten as one hull
+    shape = None
+    for item in p:
+        vertices = []
+        for vert in item.faces().vertices().objects:
+            v0 = vert.toTuple()
+            vertices.append(np.array(v0))
+            vertices.append(np.array([v0[0], v0[1], -10]))
+
+        t_shape = helpers_cadquery.hull_from_points(vertices)
+        if shape is None:
+            shape = t_shape
+        shape = helpers_cadquery.union([shape, helpers_cadquery.hull_from_shapes((shape, t_shape))])
+
+    return helpers_cadquery.built(shape)
+
+
+def wall_brace_volumes(env):
+    braces = []
+    for column in range(env["ncols"]):
+        braces.append((column, 0, 0, 1, env["web_post_tl"](), column, 0, 0, 1, env["web_post_tr"](), True))
+        row = env["bottom_key"](column)
+        braces.append((column, row, 0, -1, env["web_post_bl"](), column, row, 0, -1, env["web_post_br"](), False))
+
+    volumes = []
+    for brace in braces:
+        volumes.append(env["built"](env["key_wall_brace"](*brace)).val().Volume())
+    return volumes
+
+
+def main():
+    data = load_json(os.path.join("src", "run_config.json"))
+    data.update({"ENGINE": "cadquery", "overrides": ""})
+
+    current = dactyl_manuform.make_dactyl(data, task=wall_brace_volumes)
+    # make_dactyl() copies the engine helpers into its globals, so swap the helper itself
+    bottom_hull = helpers_cadquery.bottom_hull
+    helpers_cadquery.bottom_hull = legacy_bottom_hull
+    try:
+        legacy = dactyl_manuform.make_dactyl(data, task=wall_brace_volumes)
+    finally:
+        helpers_cadquery.bottom_hull = bottom_hull
+
+    failed = 0
+    for i, (new, old) in enumerate(zip(current, legacy)):
+        ok = abs(new - old) <= tolerance * max(1.0, abs(old))
+        failed += not ok
+        print("wall_brace {:>2}: {:12.4f} {:12.4f}  {}".format(i, new, old, "ok" if ok else "DIFFERS"))
+
+    print("{} of {} wall braces differ".format(failed, len(current)))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -82,51 +82,39 @@ class DefaultCluster(object):
                 z = shift_column * -10
         return [x, y, z]
 
+    def thumb_matrix(self):
+        return transforms.rotation_degrees(self.thumb_rotate()) @ transforms.translation(self.thumborigin())
+
+    def key_matrix(self, rot, pos):
+        # rotate by rot, move to pos, then into the cluster's own placement
+        return self.thumb_matrix() @ transforms.translation(pos) @ transforms.rotation_degrees(rot)
+
     def thumb_place(self, shape):
-        shape = translate(shape, self.thumborigin())
-        return rotate(shape, self.thumb_rotate())
+        return transform(shape, self.thumb_matrix())
 
     def tl_place(self, shape):
         debugprint('tl_place()')
-        shape = rotate(shape, self.tl_rot)
-        shape = translate(shape, self.tl_pos)
-        shape = self.thumb_place(shape)
-        return shape
+        return transform(shape, self.key_matrix(self.tl_rot, self.tl_pos))
 
     def tr_place(self, shape):
         debugprint('tr_place()')
-        shape = rotate(shape, self.tr_rot)
-        shape = translate(shape, self.tr_pos)
-        shape = self.thumb_place(shape)
-        return shape
+        return transform(shape, self.key_matrix(self.tr_rot, self.tr_pos))
 
     def mr_place(self, shape):
         debugprint('mr_place()')
-        shape = rotate(shape, self.mr_rot)
-        shape = translate(shape, self.mr_pos)
-        shape = self.thumb_place(shape)
-        return shape
+        return transform(shape, self.key_matrix(self.mr_rot, self.mr_pos))
 
     def ml_place(self, shape):
         debugprint('ml_place()')
-        shape = rotate(shape, self.ml_rot)
-        shape = translate(shape, self.ml_pos)
-        shape = self.thumb_place(shape)
-        return shape
+        return transform(shape, self.key_matrix(self.ml_rot, self.ml_pos))
 
     def br_place(self, shape):
         debugprint('br_place()')
-        shape = rotate(shape, self.br_rot)
-        shape = translate(shape, self.br_pos)
-        shape = self.thumb_place(shape)
-        return shape
+        return transform(shape, self.key_matrix(self.br_rot, self.br_pos))
 
     def bl_place(self, shape):
         debugprint('bl_place()')
-        shape = rotate(shape, self.bl_rot)
-        shape = translate(shape, self.bl_pos)
-        shape = self.thumb_place(shape)
-        return shape
+        return transform(shape, self.key_matrix(self.bl_rot, self.bl_pos))
 
     def thumb_1x_layout(self, shape, cap=False):
         debugprint('thumb_1x_layout()')
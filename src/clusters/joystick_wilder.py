@@ -100,8 +100,7 @@ class JoystickWild(TrackballOrbyl):
     def tl_place(self, shape):
         shape = rotate(shape, [0, 0, 0])
         t_off = self.key_translation_offsets[0]
-        shape = rotate(shape, self.key_rotation_offsets[0])
-        shape = translate(shape, (t_off[0], t_off[1]+self.key_diameter/2, t_off[2]))
+        shape = place(shape, self.key_rotation_offsets[0], (t_off[0], t_off[1]+self.key_diameter/2, t_off[2]))
         shape = rotate(shape, [0, 0, -80])
         shape = self.track_place(shape)
 
@@ -145,7 +144,7 @@ class JoystickWild(TrackballOrbyl):
         pcb_mount = difference(pcb_mount, [cylinder(joystick_hole_radius, 20)])
         origin = self.thumborigin()
         origin = [origin[0] - 20, origin[1] - 20, origin[2]]
-        return translate(rotate(pcb_mount, (20, 0, 30)), origin)
+        return place(pcb_mount, (20, 0, 30), origin)
 
     def thumb_connectors(self, side="right"):
         print('thumb_connectors()')
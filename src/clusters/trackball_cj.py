@@ -94,17 +94,17 @@ class TrackballCJ(TrackballOrbyl):
         ])
 
     def tbcj_edge_post(self, i):
-        shape = box(post_size, post_size, self.tbcj_thickness)
+        shape = point_box(post_size, post_size, self.tbcj_thickness)
         shape = self.oct_corner(i, self.tbcj_outer_diameter, shape)
         return shape
 
     def tbcj_web_post(self, i):
-        shape = box(post_size, post_size, self.tbcj_thickness)
+        shape = point_box(post_size, post_size, self.tbcj_thickness)
         shape = self.oct_corner(i, self.tbcj_outer_diameter, shape)
         return shape
 
     def tbcj_holder(self):
-        center = box(post_size, post_size, self.tbcj_thickness)
+        center = point_box(post_size, post_size, self.tbcj_thickness)
 
         shape = []
         for i in range(8):
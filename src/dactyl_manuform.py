@@ -1,48 +1,77 @@
+import sys
+import startup_profile
+if "--startup-profile" in sys.argv:
+    # before the other imports, so they are timed too
+    startup_profile.enable()
+
 import datetime
 
 import numpy as np
 from numpy import pi
 import os.path as path
 import getopt
-import sys
 import json
 import os
 import importlib
-import git
+import multiprocessing
 import time
-from clusters.default_cluster import DefaultCluster
-from clusters.carbonfet import CarbonfetCluster
-from clusters.mini import MiniCluster
-from clusters.minidox import MinidoxCluster
-from clusters.minithicc import Minithicc
-from clusters.minithicc3 import Minithicc3
-from clusters.trackball_orbyl import TrackballOrbyl
-from clusters.trackball_two import TrackballTwo
-from clusters.trackball_orbyl5 import TrackballOrbyl5
-from clusters.trackball_wilder import TrackballWild
-from clusters.joystick_wilder import JoystickWild
-from clusters.trackball_three import TrackballThree
-from clusters.trackball_cj import TrackballCJ
-from clusters.custom_cluster import CustomCluster
-from clusters.trackball_btu import TrackballBTU
-from clusters.trackball_one import TrackballOne
 
 from json_loader import load_json
+import build_trace
+import memory_stats
+import operation_stats
+import transforms
 
 from os import path
 import subprocess
 
 
+# thumb_style -> (module, class); a cluster's module is imported only when a configuration uses it
+cluster_classes = {
+    "DEFAULT": ("clusters.default_cluster", "DefaultCluster"),
+    "CARBONFET": ("clusters.carbonfet", "CarbonfetCluster"),
+    "MINI": ("clusters.mini", "MiniCluster"),
+    "MINIDOX": ("clusters.minidox", "MinidoxCluster"),
+    "MINITHICC": ("clusters.minithicc", "Minithicc"),
+    "MINITHICC3": ("clusters.minithicc3", "Minithicc3"),
+    "TRACKBALL_ORBYL": ("clusters.trackball_orbyl", "TrackballOrbyl"),
+    "TRACKBALL_ORBYL5": ("clusters.trackball_orbyl5", "TrackballOrbyl5"),
+    "TRACKBALL_WILD": ("clusters.trackball_wilder", "TrackballWild"),
+    "JOYSTICK_WILD": ("clusters.joystick_wilder", "JoystickWild"),
+    "TRACKBALL_THREE": ("clusters.trackball_three", "TrackballThree"),
+    "TRACKBALL_ONE": ("clusters.trackball_one", "TrackballOne"),
+    "TRACKBALL_TWO": ("clusters.trackball_two", "TrackballTwo"),
+    "TRACKBALL_BTU": ("clusters.trackball_btu", "TrackballBTU"),
+    "TRACKBALL_CJ": ("clusters.trackball_cj", "TrackballCJ"),
+    "CUSTOM": ("clusters.custom_cluster", "CustomCluster"),
+}
+
+
+def cluster_class(style):
+    module, name = cluster_classes.get(style, cluster_classes["DEFAULT"])
+    return getattr(importlib.import_module(module), name)
+
+
+_git_info = None
+
+
 def get_git_info():
-    repo = git.Repo(search_parent_directories=True)
-    sha = repo.head.object.hexsha
-    active_branch = repo.active_branch.name
-    return {
-        "branch": active_branch,
-        "sha": sha,
-        "datetime": time.ctime(time.time()),
-        "dirty": repo.is_dirty()
-    }
+    # The repository is read once per process and only by builds that need it, for the branch
+    # check and the build report.  Without git, or outside a checkout, the fields are None.
+    global _git_info
+    if _git_info is None:
+        try:
+            import git
+            repo = git.Repo(search_parent_directories=True)
+            _git_info = {
+                "branch": repo.active_branch.name if not repo.head.is_detached else None,
+                "sha": repo.head.object.hexsha,
+                "dirty": repo.is_dirty()
+            }
+        except Exception as e:
+            print("No git information: {}".format(e))
+            _git_info = {"branch": None, "sha": None, "dirty": None}
+    return dict(_git_info, datetime=time.ctime(time.time()))
     # try:
     #     output = str(
     #         subprocess.check_output(
@@ -57,6 +86,35 @@ def get_git_info():
     #     log("No git repository found.", "ERROR")
     #     return None
 
+def _flushing(task):
+    # task, then hand this process's operation counts to the parent
+    def run():
+        task()
+        operation_stats.flush()
+
+    return run
+
+
+def run_in_processes(tasks):
+    # Run each named, zero-argument callable in its own forked process and wait for all of them.
+    if "fork" not in multiprocessing.get_all_start_methods():
+        for task in tasks.values():
+            task()
+        return
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_flushing(task), name=name) for name, task in tasks.items()]
+    for process in processes:
+        process.start()
+    failed = []
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            failed.append(process.name)
+    if failed:
+        raise RuntimeError("Build failed for: {}".format(", ".join(failed)))
+
+
 def deg2rad(degrees: float) -> float:
     return degrees * pi / 180
 
@@ -68,6 +126,11 @@ def rad2deg(rad: float) -> float:
 debug_exports = False
 debug_trace = False
 
+# Left out of every stage key: the stage cache does not follow these into stages(), or every key
+# would take in every stage.  A stage's key takes in the stages upstream of it through
+# upstream_sources() instead.
+stage_plumbing = ["stages", "cached_stage", "declared_stage_key"]
+
 
 def debugprint(info):
     if debug_trace:
@@ -82,7 +145,10 @@ def debugprint(info):
 
 
 
-def make_dactyl():
+def make_dactyl(data=None, task=None):
+    # data: an already merged configuration, used instead of the command line and run_config.json.
+    # task: called with the generator namespace instead of run(), its result is returned.
+    startup_profile.mark("imports")
     def is_side(side, param):
         return param == side or param == "both"
 
@@ -97,6 +163,37 @@ def make_dactyl():
     def encoder_in_wall(side="right"):
         return encoder_type(side) != "none"
 
+    def is_symmetric():
+        # True only when nothing in the configuration treats the two sides differently, so the
+        # left half is exactly the mirror image of the right one and need not be built again.
+        if symmetry == "asymmetric":
+            return False
+        if skip_keys is not None:
+            # skip_keys entries name their side, the same holes have to be filled on both
+            skipped = {side: {(key["col"], key["row"]) for key in skip_keys if key["side"] == side}
+                       for side in ["right", "left"]}
+            if skipped["right"] != skipped["left"]:
+                return False
+        if cluster("right").name() != cluster("left").name() or cluster("right").is_tb or trackball_in_wall:
+            return False
+        if plate_file is not None or (plate_holes and plate_holes_xy_offset[0] != 0):
+            return False
+        if is_oled("right") != is_oled("left") or encoder_in_wall("right") or encoder_in_wall("left"):
+            return False
+        if is_side("right", controller_side) != is_side("left", controller_side):
+            return False
+        if controller_mount_type in ["EXTERNAL_BREAKOUT", "ASSIMILATOR"]:
+            return False
+        if controller_mount_type == "USB_C_WALL" and usb_c_mounts["right"] != usb_c_mounts["left"]:
+            return False
+        return logo_file in ["", None]
+
+    def built_sides():
+        # the sides run() builds model_side() for, the others are mirrored or skipped
+        if right_side_only or quickly or is_symmetric():
+            return ["right"]
+        return ["right", "left"]
+
     def get_descriptor_name_side(side="right"):
         name = ""
         if overrides_name != "":
@@ -278,14 +375,12 @@ def make_dactyl():
     for item in cfg.shape_config:
         globals()[item] = cfg.shape_config[item]
 
-    data = None
-
     overrides_name = ""
 
-    git_data = get_git_info()
-    local_branch = git_data["branch"]
         ## CHECK FOR CONFIG FILE AND WRITE TO ANY VARIABLES IN FILE.
-    opts, args = getopt.getopt(sys.argv[1:], "", ["config=", "save_path=", "overrides="])
+    opts = []
+    if data is None:
+        opts, args = getopt.getopt(sys.argv[1:], "", ["config=", "save_path=", "overrides=", "startup-profile"])
     for opt, arg in opts:
         if opt in '--config':
             with open(os.path.join(r".", "configs", arg + '.json'), mode='r') as fid:
@@ -298,7 +393,7 @@ def make_dactyl():
             overrides_name = arg
 
     if data is None:
-        print(f">>> Using config run_config.json on Git branch {local_branch}")
+        print(f">>> Using config run_config.json on Git branch {get_git_info()['branch']}")
         data = load_json(os.path.join("src", "run_config.json"), save_path)
         # with open(os.path.join("src", "run_config.json"), mode='r') as fid:
         #     data = json.load(fid)
@@ -320,6 +415,7 @@ def make_dactyl():
 
     try:
         if data["branch"] not in ["", None]:
+            local_branch = get_git_info()["branch"]
             if data["branch"] != local_branch:
                 print(f"INCORRECT GIT BRANCH! Local is {local_branch} but config requires {data['branch']}.  Exiting.")
                 sys.exit(101)
@@ -328,6 +424,7 @@ def make_dactyl():
 
     for item in data:
         globals()[item] = data[item]
+    startup_profile.mark("configuration")
 
     if save_name not in ['', None]:
         config_name = save_name
@@ -372,8 +469,14 @@ def make_dactyl():
 
     if ENGINE == 'cadquery':
         globals().update(importlib.import_module("helpers_cadquery").__dict__)
+        set_primitive_cache_size(primitive_cache_size)
+        set_part_disk_cache(part_brep_cache)
+        set_union_strategy(union_strategy)
+        set_boolean_parallel(boolean_parallel)
+        set_stage_cache(stage_cache_dir, stage_cache_size_mb, [*cfg.build_settings, *stage_plumbing])
     else:
         globals().update(importlib.import_module("helpers_solid").__dict__)
+    startup_profile.mark("engine helpers ({})".format(ENGINE))
 
     ####################################################
     # END HELPER FUNCTIONS
@@ -512,7 +615,16 @@ def make_dactyl():
         return column_offsets[c]
 
 
+    plate_cache = {}
+
     def single_plate(cylinder_segments=100, side="right"):
+        # The switch plate only depends on side and style, so model it once and hand out placed instances.
+        key = (side, plate_style)
+        if key not in plate_cache:
+            plate_cache[key] = build_single_plate(cylinder_segments=cylinder_segments, side=side)
+        return instance(plate_cache[key])
+
+    def build_single_plate(cylinder_segments=100, side="right"):
         if plate_style == "MXLEDBIT":
             pcb_width = 19
             pcb_length = 19
@@ -532,7 +644,7 @@ def make_dactyl():
             # # frame = difference(frame, [box(pcb_width - 1, pcb_length - 1, pcb_height * 4)])
             frame = difference(frame, [box(18.5, 18.5, 5)])
             frame = difference(frame, [box(19.5, 19.5, 2.5)])
-            connector = translate(rotate(box(21, 4, 2.5), (degrees, 0, 0)), (0, 11.5, 0))
+            connector = place(box(21, 4, 2.5), (degrees, 0, 0), (0, 11.5, 0))
             frame = translate(union([frame, connector]), (0, 0, -5))
             return frame
 
@@ -546,8 +658,7 @@ def make_dactyl():
             left_wall = translate(left_wall, ((lr_border / 2) + (keyswitch_width / 2), 0, plate_thickness / 2))
 
             side_nub = cylinder(radius=1, height=2.75)
-            side_nub = rotate(side_nub, (90, 0, 0))
-            side_nub = translate(side_nub, (keyswitch_width / 2, 0, 1))
+            side_nub = place(side_nub, (90, 0, 0), (keyswitch_width / 2, 0, 1))
 
             nub_cube = box(1.5, 2.75, plate_thickness)
             nub_cube = translate(nub_cube, ((1.5 / 2) + (keyswitch_width / 2), 0, plate_thickness / 2))
@@ -922,9 +1033,25 @@ def make_dactyl():
         return rotate(shape, [0, rad2deg(angle), 0])
 
 
+    key_transforms = {}
+
+    def key_transform(column, row):
+        # One 4x4 transform per key, built by running the key geometry on a matrix instead of a shape.
+        key = (column, row)
+        if key not in key_transforms:
+            key_transforms[key] = apply_key_geometry(
+                transforms.identity(),
+                transforms.translate_matrix,
+                transforms.rotate_x_matrix,
+                transforms.rotate_y_matrix,
+                column,
+                row,
+            )
+        return key_transforms[key]
+
     def key_place(shape, column, row):
         debugprint('key_place()')
-        return apply_key_geometry(shape, translate, x_rot, y_rot, column, row)
+        return transform(shape, key_transform(column, row))
 
 
     def cluster_key_place(shape, column, row):
@@ -935,7 +1062,7 @@ def make_dactyl():
         # if c > ncols - 1:
         #     c = ncols - 1
         # c = column if not inner_column else column + 1
-        return apply_key_geometry(shape, translate, x_rot, y_rot, c, row)
+        return transform(shape, key_transform(c, row))
     def add_translate(shape, xyz):
         debugprint('add_translate()')
         vals = []
@@ -946,9 +1073,7 @@ def make_dactyl():
 
     def key_position(position, column, row):
         debugprint('key_position()')
-        return apply_key_geometry(
-            position, add_translate, rotate_around_x, rotate_around_y, column, row
-        )
+        return transforms.apply(key_transform(column, row), position)[0].tolist()
 
 
     def key_holes(side="right"):
@@ -996,7 +1121,7 @@ def make_dactyl():
 
     def web_post():
         debugprint('web_post()')
-        post = box(post_size, post_size, web_thickness)
+        post = point_box(post_size, post_size, web_thickness)
         post = translate(post, (0, 0, plate_thickness - (web_thickness / 2)))
         return post
 
@@ -1241,7 +1366,7 @@ def make_dactyl():
         # ]
 
     def wall_spot(point):
-        return translate(box(0.1, 0.1, 0.1), point)
+        return translate(point_box(0.1, 0.1, 0.1), point)
 
     def offset_point(point, angle, z_offset, thickness):
         dx = -np.sin(np.radians(angle))
@@ -1586,8 +1711,8 @@ def make_dactyl():
 
     def trrs_mount_point():
         shape = box(6.2, 14, 5.2)
-        jack = translate(rotate(cylinder(2.6, 5), (90, 0, 0)), (0, 9, 0))
-        jack_entry = translate(rotate(cylinder(4, 5), (90, 0, 0)), (0, 11, 0))
+        jack = place(cylinder(2.6, 5), (90, 0, 0), (0, 9, 0))
+        jack_entry = place(cylinder(4, 5), (90, 0, 0), (0, 11, 0))
         shape = rotate(translate(union([shape, jack, jack_entry]), (0, 0, 10)), (0, 0, 75))
 
         # shape = translate(shape,
@@ -1617,12 +1742,12 @@ def make_dactyl():
         # row_position[1] += 10
         def low_prep_position(sh, prefix=side):
             if trackball_is_in_wall(side) and prefix == side:
-                return translate(rotate(sh, tbiw_encoder_wall_rotation), tbiw_encoder_wall_offset)
+                return place(sh, tbiw_encoder_wall_rotation, tbiw_encoder_wall_offset)
             elif prefix == "right":
-                return translate(rotate(sh, right_encoder_wall_rotation), right_encoder_wall_offset)
+                return place(sh, right_encoder_wall_rotation, right_encoder_wall_offset)
             elif prefix == "other":
-                return translate(rotate(sh, other_encoder_wall_rotation), other_encoder_wall_offset)
-            return translate(rotate(sh, left_encoder_wall_rotation), left_encoder_wall_offset)
+                return place(sh, other_encoder_wall_rotation, other_encoder_wall_offset)
+            return place(sh, left_encoder_wall_rotation, left_encoder_wall_offset)
 
         def handle_ec11(shape, prefix="right"):
             ec11_mount_low = low_prep_position(rotate(single_plate(side=side), (0, 0, 90)), prefix=prefix)
@@ -1652,7 +1777,7 @@ def make_dactyl():
             # encoder_mount = translate(rotate(encoder_mount, (0, 0, 20)), (-27, -4, -15))
             return shape
         def high_prep_position(sh):
-            return translate(rotate(sh, (-4, -38, 10)), (6, 0, -15))
+            return place(sh, (-4, -38, 10), (6, 0, -15))
 
         if encoder_type(side) == "ec11":
             shape = handle_ec11(shape, prefix=side)
@@ -1669,8 +1794,8 @@ def make_dactyl():
 
     def usb_c_shape(width, height, depth):
         shape = box(width, depth, height)
-        cyl1 = translate(rotate(cylinder(height / 2, depth), (90, 0, 0)), (width / 2, 0, 0))
-        cyl2 = translate(rotate(cylinder(height / 2, depth), (90, 0, 0)), (-width / 2, 0, 0))
+        cyl1 = place(cylinder(height / 2, depth), (90, 0, 0), (width / 2, 0, 0))
+        cyl2 = place(cylinder(height / 2, depth), (90, 0, 0), (-width / 2, 0, 0))
         return union([shape, cyl1, cyl2])
 
 
@@ -1750,8 +1875,7 @@ def make_dactyl():
         ]
 
         logo = import_file(logo_file)
-        logo = rotate(logo, (90, 0, 180))
-        logo = translate(logo, offset)
+        logo = place(logo, (90, 0, 180), offset)
         return logo
 
     def external_mount_hole():
@@ -1820,8 +1944,7 @@ def make_dactyl():
         cutter = import_file(tbcut_file)
 
         if joystick:
-            shape = rotate(shape, (0, 0, 35))
-            shape = translate(shape, (0, 0, 1.2))
+            shape = place(shape, (0, 0, 35), (0, 0, 1.2))
 
         if not btus and not ceramic:
             cutter = union([cutter, import_file(senscut_file)])
@@ -1842,51 +1965,40 @@ def make_dactyl():
             tb_t_offset = tb_btu_socket_translation_offset
             tb_r_offset = tb_btu_socket_rotation_offset
 
-        precut = trackball_cutout()
-        precut = rotate(precut, tb_r_offset)
-        precut = translate(precut, tb_t_offset)
-        precut = rotate(precut, rot)
-        precut = translate(precut, pos)
+        # socket offsets first, then the ball position, composed into one placement per shape
+        offset_matrix = transforms.translation(tb_t_offset) @ transforms.rotation_degrees(tb_r_offset)
+        ball_matrix = transforms.translation(pos) @ transforms.rotation_degrees(rot)
+        socket_matrix = ball_matrix @ offset_matrix
+
+        precut = transform(trackball_cutout(), socket_matrix)
 
         shape, cutout, sensor = trackball_socket(btus=use_btus(cluster))
 
         if corner_walls:
             shape = translate(cylinder(21, 3), (0, 0, -1.5))
-        shape = rotate(shape, tb_r_offset)
-        shape = translate(shape, tb_t_offset)
-        shape = rotate(shape, rot)
-        shape = translate(shape, pos)
+        shape = transform(shape, socket_matrix)
 
         if cluster is not None and resin is False:
             shape = cluster.get_extras(shape, pos)
 
-        cutout = rotate(cutout, tb_r_offset)
-        cutout = translate(cutout, tb_t_offset)
         # cutout = rotate(cutout, tb_sensor_translation_offset)
         # cutout = translate(cutout, tb_sensor_rotation_offset)
-        cutout = rotate(cutout, rot)
-        cutout = translate(cutout, pos)
+        cutout = transform(cutout, socket_matrix)
 
         # Small adjustment due to line to line surface / minute numerical error issues
         # Creates small overlap to assist engines in union function later
-        sensor = rotate(sensor, tb_r_offset)
-        sensor = translate(sensor, tb_t_offset)
+        sensor_offset = [0, 0, .005]
 
         # Hackish?  Oh, yes. But it builds with latest cadquery.
         if ENGINE == 'cadquery':
-            sensor = translate(sensor, (0, 0, -15))
+            sensor_offset[2] -= 15
         # sensor = rotate(sensor, tb_sensor_translation_offset)
         # sensor = translate(sensor, tb_sensor_rotation_offset)
-        sensor = translate(sensor, (0, 0, .005))
-        sensor = rotate(sensor, rot)
-        sensor = translate(sensor, pos)
+        sensor = transform(sensor, ball_matrix @ transforms.translation(sensor_offset) @ offset_matrix)
 
         ball = trackball_ball()
         ball = difference(ball, [translate(box(35, 35, 34), (0, 0, -18))])
-        ball = rotate(ball, tb_r_offset)
-        ball = translate(ball, tb_t_offset)
-        ball = rotate(ball, rot)
-        ball = translate(ball, pos)
+        ball = transform(ball, socket_matrix)
 
         if corner_walls:
             ball = union([shape, ball])
@@ -2309,7 +2421,7 @@ def make_dactyl():
             else:
                 cyl = union([cyl, new_cyl])
             offset -= height / 2
-        cyl = translate(rotate(cyl, (0, 180, 0)), (0, 0, -0.01))
+        cyl = place(cyl, (0, 180, 0), (0, 0, -0.01))
         return cyl, sum(heights)
 
 
@@ -2468,34 +2580,89 @@ def make_dactyl():
 
         shape = union((s1, s2))
         shape = translate(shape, [0, -offset, (-wire_post_height / 2) + 3])
-        shape = rotate(shape, [-alpha / 2, 0, 0])
-        shape = translate(shape, (3, -mount_height / 2, 0))
+        shape = place(shape, [-alpha / 2, 0, 0], (3, -mount_height / 2, 0))
 
         return shape
 
-    def model_side(side="right"):
-        print('model_side()' + side)
-        shape = union([key_holes(side=side)])
+    def stages(side="right"):
+        # Every stage of a side built through cached(), declared once for the build and for
+        # build_graph.py: name -> (build, args, kwargs, upstream).  The shapes of the upstream
+        # stages a stage takes are given to cached_stage() and come before args.
+        return {
+            "key_holes": (key_holes, (), {"side": side}, []),
+            "connectors": (connectors, (), {}, []),
+            "thumb": (cluster(side).thumb, (), {"side": side}, []),
+            "thumb_connectors": (cluster(side).thumb_connectors, (), {"side": side}, []),
+            "case_walls": (case_walls, (), {"side": side}, []),
+            "screw_insert_outers": (screw_insert_outers, (), {"side": side}, []),
+            "trackball_in_wall": (generate_trackball_in_wall, (), {}, []),
+            "trackball_in_cluster": (generate_trackball_in_cluster, (cluster(side),), {}, []),
+            "model_side_prefix": (model_side_prefix, (), {"side": side},
+                                  ["key_holes", "connectors", "thumb", "thumb_connectors", "case_walls",
+                                   "screw_insert_outers"]),
+            "model_side": (model_side, (), {"side": side},
+                           ["model_side_prefix", "trackball_in_wall", "trackball_in_cluster"]),
+            "baseplate": (baseplate, (), {"side": side}, ["model_side"]),
+            "wrist_rest": (wrist_rest, (), {"side": side}, ["model_side", "baseplate"]),
+        }
+
+    def upstream_sources(name, side="right"):
+        # the builds and inputs of every stage upstream of name, which its result depends on too
+        declared = stages(side)
+        sources = []
+        for upstream in declared[name][3]:
+            build, args, _, _ = declared[upstream]
+            sources += [build, *args, *upstream_sources(upstream, side)]
+        return sources
+
+    def cached_stage(name, *shapes, side="right"):
+        build, args, kwargs, _ = stages(side)[name]
+        return cached(name, build, *shapes, *args, depends=upstream_sources(name, side), **kwargs)
+
+    def declared_stage_key(name, *shapes, side="right"):
+        # the key cached_stage() would store the stage under
+        build, args, kwargs, _ = stages(side)[name]
+        return stage_key(name, build, *shapes, *args, depends=upstream_sources(name, side), **kwargs)
+
+    def independent_stages():
+        # the stages model_side() starts from, none of which depends on another
+        return ["key_holes", "connectors", "thumb", "thumb_connectors", "case_walls"]
+
+    def model_side_prefix(side="right"):
+        # The part of model_side() before the controller, OLED, encoder and trackball options
+        # come in: the key plate with the thumb, and the walls with the screw insert outers.
+        # none of these depend on each other, so they are built side by side
+        parts = build_parallel({
+            name: lambda name=name: cached_stage(name, side=side) for name in independent_stages()
+        }, processes=build_processes)
+
+        shape = union([parts["key_holes"]])
         if debug_exports:
             export_file(shape=shape, fname=path.join(r".", "things", r"debug_key_plates"))
-        connector_shape = connectors()
+        connector_shape = parts["connectors"]
         shape = union([shape, connector_shape])
         if debug_exports:
             export_file(shape=shape, fname=path.join(r".", "things", r"debug_connector_shape"))
-        thumb_shape = cluster(side).thumb(side=side)
+        thumb_shape = parts["thumb"]
         if debug_exports:
             export_file(shape=thumb_shape, fname=path.join(r".", "things", r"debug_thumb_shape"))
         shape = union([shape, thumb_shape])
-        thumb_connector_shape = cluster(side).thumb_connectors(side=side)
+        thumb_connector_shape = parts["thumb_connectors"]
         shape = union([shape, thumb_connector_shape])
         if debug_exports:
             export_file(shape=shape, fname=path.join(r".", "things", r"debug_thumb_connector_shape"))
-        walls_shape = case_walls(side=side)
+        walls_shape = parts["case_walls"]
         if debug_exports:
             export_file(shape=walls_shape, fname=path.join(r".", "things", r"debug_walls_shape"))
         s2 = union([walls_shape])
         if not corner_walls:
-            s2 = union([s2, *screw_insert_outers(side=side)])
+            s2 = union([s2, *cached_stage("screw_insert_outers", side=side)])
+
+        return shape, s2, walls_shape
+
+    def model_side(side="right"):
+        print('model_side()' + side)
+        shape, s2, walls_shape = cached_stage("model_side_prefix", side=side)
 
         if trrs_hole:
             s2 = difference(s2, [trrs_mount_point()])
@@ -2530,7 +2697,7 @@ def make_dactyl():
                 0  # do nothing, only here to expressly state inaction.
 
         if not corner_walls:
-            s2 = difference(s2, [union(screw_insert_holes(side=side))])
+            s2 = difference(s2, screw_insert_holes(side=side))
 
         if side == "right" and logo_file not in ["", None]:
             s2 = union([s2, get_logo()])
@@ -2562,7 +2729,7 @@ def make_dactyl():
 
         if not quickly:
             if trackball_is_in_wall(side):
-                tbprecut, tb, tbcutout, sensor, ball = generate_trackball_in_wall()
+                tbprecut, tb, tbcutout, sensor, ball = cached_stage("trackball_in_wall", side=side)
 
                 if not corner_walls:
                     if use_btus(cluster()):
@@ -2584,7 +2751,7 @@ def make_dactyl():
                     shape = add([shape, ball])
 
             elif cluster(side).is_tb:
-                tbprecut, tb, tbcutout, sensor, ball = generate_trackball_in_cluster(cluster(side))
+                tbprecut, tb, tbcutout, sensor, ball = cached_stage("trackball_in_cluster", side=side)
 
                 if not corner_walls:
                     shape = difference(shape, [tbprecut])
@@ -2622,8 +2789,7 @@ def make_dactyl():
 
     def wrist_rest(top, plate, side="right"):
         rest = import_file(path.join(parts_path, "dactyl_wrist_rest_v3_right"))
-        rest = rotate(rest, (0, 0, -60))
-        rest = translate(rest, (30, -160, 26))
+        rest = place(rest, (0, 0, -60), (30, -160, 26))
         # solid = union([plate, translate(top, (0, 0, 5))])
         rest = difference(rest, [translate(top, (0, 0, -0.5))])
         # rest = union([rest, plate])
@@ -2638,14 +2804,10 @@ def make_dactyl():
             # tool = translate(screw_insert_screw_holes(side=side), [0, 0, -10])
             if magnet_bottom:
                 tool = screw_insert_all_shapes(screw_hole_diameter / 2., screw_hole_diameter / 2., 2.1, side=side)
-                for item in tool:
-                    item = translate(item, [0, 0, 1.2])
-                    shape = difference(shape, [item])
+                shape = difference(shape, [translate(item, [0, 0, 1.2]) for item in tool])
             else:
                 tool = screw_insert_all_shapes(screw_hole_diameter / 2., screw_hole_diameter / 2., 350, side=side)
-                for item in tool:
-                    item = translate(item, [0, 0, -10])
-                    shape = difference(shape, [item])
+                shape = difference(shape, [translate(item, [0, 0, -10]) for item in tool])
 
             shape = translate(shape, (0, 0, -0.0001))
 
@@ -2735,8 +2897,7 @@ def make_dactyl():
                         .loft(combine=True)
                     )
 
-                    screw = cq.importers.importStep(
-                        os.path.abspath(os.path.join(r"src", "parts", "quarter_inch_screw.step"))).translate([0, 0, -9])
+                    screw = translate(import_file(path.join(parts_path, "quarter_inch_screw")), [0, 0, -9])
 
                     mid_row = int(np.floor(nrows / 2))
 
@@ -2815,62 +2976,89 @@ def make_dactyl():
 
 
     def run():
+        global build_processes
         right_name = get_descriptor_name_side(side="right")
         left_name = get_descriptor_name_side(side="left")
-        mod_r, walls_r = model_side(side="right")
-        base = baseplate(walls_r, side='right')
-        rest_r = wrist_rest(mod_r, base, side="right")
-
-        if resin and tilt_resin and ENGINE == "cadquery":
-            mod_r = rotate(mod_r, (333.04, 43.67, 85.00))
-        export_file(shape=mod_r, fname=path.join(save_path, right_name + r"_TOP"))
-
-        # print(f"Right descriptor name: {get_descriptor_name_side(side='right')}")
-        # print(f"Left descriptor name: {get_descriptor_name_side(side='left')}")
-        if right_side_only:
-            print(">>>>>  RIGHT SIDE ONLY: Only rendering a the right side.")
-            return
-
-        # base = union([base, rest])
-        export_file(shape=base, fname=path.join(save_path, right_name + r"_PLATE"))
-        export_file(shape=rest_r, fname=path.join(save_path, right_name + r"_WRIST_REST"))
-        if quickly:
-            print(">>>>>  QUICK RENDER: Only rendering a the right side and bottom plate.")
-            return
-        # export_dxf(shape=base, fname=path.join(save_path, right_name + r"_PLATE"))
-
-        # rest = wrist_rest(mod_r, base, side="right")
-        #
-        # export_file(shape=rest, fname=path.join(save_path, config_name + r"_right_wrist_rest"))
-
-        # if symmetry == "asymmetric":
-
-        mod_l, walls_l = model_side(side="left")
-
-        if resin and ENGINE == "cadquery":
-            mod_l = rotate(mod_l, (333.04, 317.33, 286.35))
 
-        export_file(shape=mod_l, fname=path.join(save_path, left_name + r"_TOP"))
+        def build_right():
+            mod_r, walls_r = cached_stage("model_side", side="right")
+            base = cached_stage("baseplate", walls_r, side="right")
+            rest_r = cached_stage("wrist_rest", mod_r, base, side="right")
+            top_r = mod_r
+
+            if resin and tilt_resin and ENGINE == "cadquery":
+                mod_r = rotate(mod_r, (333.04, 43.67, 85.00))
+            export_file(shape=mod_r, fname=path.join(save_path, right_name + r"_TOP"))
+
+            # print(f"Right descriptor name: {get_descriptor_name_side(side='right')}")
+            # print(f"Left descriptor name: {get_descriptor_name_side(side='left')}")
+            if right_side_only:
+                return top_r, base
+
+            # base = union([base, rest])
+            export_file(shape=base, fname=path.join(save_path, right_name + r"_PLATE"))
+            export_file(shape=rest_r, fname=path.join(save_path, right_name + r"_WRIST_REST"))
+            # export_dxf(shape=base, fname=path.join(save_path, right_name + r"_PLATE"))
+
+            # rest = wrist_rest(mod_r, base, side="right")
+            #
+            # export_file(shape=rest, fname=path.join(save_path, config_name + r"_right_wrist_rest"))
+            return top_r, base
+
+        def build_left(right=None):
+            # right: the (top, plate) of a symmetric right half, mirrored instead of building the left side
+            if right is None:
+                mod_l, walls_l = cached_stage("model_side", side="left")
+            else:
+                mod_l = mirror(right[0], 'YZ')
 
-        base_l = baseplate(walls_l, side='left')
-        rest_l = mirror(wrist_rest(mod_l, base_l, side="left"), 'YZ')
-        base_l = mirror(base_l, "YZ")
+            if resin and ENGINE == "cadquery":
+                mod_l = rotate(mod_l, (333.04, 317.33, 286.35))
 
+            export_file(shape=mod_l, fname=path.join(save_path, left_name + r"_TOP"))
 
+            # baseplate() works in right-hand coordinates for both sides, see the mirror below
+            base_l = cached_stage("baseplate", walls_l, side="left") if right is None else right[1]
+            rest_l = mirror(cached_stage("wrist_rest", mod_l, base_l, side="left"), 'YZ')
+            base_l = mirror(base_l, "YZ")
 
-        export_file(shape=base_l, fname=path.join(save_path, left_name + r"_PLATE"))
-        # export_dxf(shape=base_l, fname=path.join(save_path, left_name + r"_PLATE"))
-        export_file(shape=rest_l, fname=path.join(save_path, left_name + r"_WRIST_REST"))
-        # else:
-        #     export_file(shape=mirror(mod_r, 'YZ'), fname=path.join(save_path, config_name + r"_left"))
-        #
-        #     lbase = mirror(base, 'YZ')
-        #     export_file(shape=lbase, fname=path.join(save_path, config_name + r"_left_plate"))
-        #     export_dxf(shape=lbase, fname=path.join(save_path, config_name + r"_left_plate"))
+            export_file(shape=base_l, fname=path.join(save_path, left_name + r"_PLATE"))
+            # export_dxf(shape=base_l, fname=path.join(save_path, left_name + r"_PLATE"))
+            export_file(shape=rest_l, fname=path.join(save_path, left_name + r"_WRIST_REST"))
+            # else:
+            #     export_file(shape=mirror(mod_r, 'YZ'), fname=path.join(save_path, config_name + r"_left"))
+            #
+            #     lbase = mirror(base, 'YZ')
+            #     export_file(shape=lbase, fname=path.join(save_path, config_name + r"_left_plate"))
+            #     export_dxf(shape=lbase, fname=path.join(save_path, config_name + r"_left_plate"))
+
+        symmetric = is_symmetric()
+        if right_side_only or quickly or symmetric or not concurrent_sides:
+            if not (right_side_only or quickly or symmetric) and ENGINE == 'cadquery' and build_processes != 1:
+                # the left side forks its workers after the right side ran its booleans in this
+                # process, which must not have started OCC's threads by then
+                set_boolean_parallel(False)
+            right = build_right()
+            if right_side_only:
+                print(">>>>>  RIGHT SIDE ONLY: Only rendering a the right side.")
+                return
+            if quickly:
+                print(">>>>>  QUICK RENDER: Only rendering a the right side and bottom plate.")
+                return
+            if symmetric:
+                print(">>>>>  SYMMETRIC: Mirroring the right side to make the left side.")
+                build_left(right)
+            else:
+                build_left()
+        else:
+            # each half, with its plate and wrist rest, in its own process; files are written as they finish.
+            # The two share the cores between their workers.
+            build_processes = max(1, (build_processes or os.cpu_count() or 1) // 2)
+            run_in_processes({"right": build_right, "left": build_left})
 
         if ENGINE == 'cadquery' and overrides_name not in [None, '']:
             import build_report as report
-            report.write_build_report(path.abspath(save_path), overrides_name, git_data)
+            report.write_build_report(path.abspath(save_path), overrides_name, get_git_info())
 
         # if oled_mount_type == 'UNDERCUT':
         #     export_file(shape=oled_undercut_mount_frame()[1],
@@ -2892,44 +3080,28 @@ def make_dactyl():
         if ENGINE != "cadquery" and render_png:
             render_samples(overrides_name, ncols, save_path)
 
+    # the stages timed in the build trace and measured by memory_stats, see build_trace.py and memory_stats.py
+    def instrumented(stage):
+        return memory_stats.measured(build_trace.traced(stage))
+
+    key_holes = instrumented(key_holes)
+    connectors = instrumented(connectors)
+    case_walls = instrumented(case_walls)
+    screw_insert_outers = instrumented(screw_insert_outers)
+    generate_trackball = instrumented(generate_trackball)
+    generate_trackball_in_cluster = instrumented(generate_trackball_in_cluster)
+    generate_trackball_in_wall = instrumented(generate_trackball_in_wall)
+    model_side_prefix = instrumented(model_side_prefix)
+    model_side = instrumented(model_side)
+    baseplate = instrumented(baseplate)
+    wrist_rest = instrumented(wrist_rest)
+
     all_merged = locals().copy()
     for item in globals():
         all_merged[item] = globals()[item]
 
     def get_cluster(style):
-        if style == CarbonfetCluster.name():
-            clust = CarbonfetCluster(all_merged)
-        elif style == MiniCluster.name():
-            clust = MiniCluster(all_merged)
-        elif style == MinidoxCluster.name():
-            clust = MinidoxCluster(all_merged)
-        elif style == Minithicc.name():
-            clust = Minithicc(all_merged)
-        elif style == Minithicc3.name():
-            clust = Minithicc3(all_merged)
-        elif style == TrackballOrbyl.name():
-            clust = TrackballOrbyl(all_merged)
-        elif style == TrackballOrbyl5.name():
-            clust = TrackballOrbyl5(all_merged)
-        elif style == TrackballWild.name():
-            clust = TrackballWild(all_merged)
-        elif style == JoystickWild.name():
-            clust = JoystickWild(all_merged)
-        elif style == TrackballThree.name():
-            clust = TrackballThree(all_merged)
-        elif style == TrackballOne.name():
-            clust = TrackballOne(all_merged)
-        elif style == TrackballTwo.name():
-            clust = TrackballTwo(all_merged)
-        elif style == TrackballBTU.name():
-            clust = TrackballBTU(all_merged)
-        elif style == TrackballCJ.name():
-            clust = TrackballCJ(all_merged)
-        elif style == CustomCluster.name():
-            clust = CustomCluster(all_merged)
-        else:
-            clust = DefaultCluster(all_merged)
-
+        clust = build_trace.trace_methods(cluster_class(style)(all_merged), ["thumb", "thumb_connectors", "walls"])
         return clust
 
 
@@ -2948,7 +3120,32 @@ def make_dactyl():
     else:
         left_cluster = right_cluster  # this assumes thumb_style always overrides DEFAULT other_thumb
 
-    run()
+    startup_profile.mark("clusters")
+    if startup_profile.enabled():
+        startup_profile.report()
+        return
+
+    if task is not None:
+        return task(all_merged)
+
+    if build_trace_file:
+        build_trace.start(path.join(save_path, get_descriptor_name_side("right") + "_TRACE.json"))
+    if operation_stats_file:
+        operation_stats.start(path.join(save_path, get_descriptor_name_side("right") + "_OPERATIONS.json"))
+    if memory_stats_file:
+        memory_stats.start(path.join(save_path, get_descriptor_name_side("right") + "_MEMORY.json"), live_shapes)
+    try:
+        with build_trace.span("build", config=config_name), memory_stats.stage("build"):
+            run()
+    finally:
+        build_trace.finish()
+        operation_stats.finish()
+        memory_stats.finish()
+
+    if ENGINE == 'cadquery':
+        print("Primitive cache: {hits} hits, {misses} misses, {size}/{max_size} cached".format(**primitive_cache_info()))
+        print("Differences: {cuts} cuts, {tools} tools, {skipped} skipped by bounding box".format(**difference_info()))
+        print("Stage cache: {hits} hits, {misses} misses, {evicted} evicted".format(**stage_cache_info()))
 
 
 #
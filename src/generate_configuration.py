@@ -454,8 +454,31 @@ shape_config = {
         [0, 0, 0],
         [0, 0, 0],
     ],
+
+    ###################################
+    ## BUILD PERFORMANCE
+    ###################################
+    'concurrent_sides': True,  # build the left and right halves, with their plates and wrist rests, in two processes at once
+    # USED FOR CADQUERY ONLY
+    'primitive_cache_size': 256,  # max number of box/cylinder/sphere/cone solids kept for reuse, 0 disables
+    'part_brep_cache': True,  # write a BREP copy next to each imported STEP part, reused while the STEP file is unchanged
+    'union_strategy': 'tree',  # pairwise balanced 'tree', 'fuse' all arguments in one boolean, or the old one-at-a-time 'fold'
+    'boolean_parallel': True,  # let OCC run fuse operations in parallel threads
+    'build_processes': 0,  # worker processes for the independent parts of each side, 0 uses every core, 1 builds them in sequence
+    'stage_cache_dir': os.path.join('.', 'stage_cache'),  # finished stages (key holes, walls, baseplate...) are kept here between runs
+    'stage_cache_size_mb': 2048,  # least recently used stages are deleted above this size, 0 disables the stage cache
+    'build_trace_file': False,  # write <name>_TRACE.json, a timing trace for chrome://tracing or ui.perfetto.dev
+    'operation_stats_file': False,  # count union/difference/hull/import/export calls by calling function, print the slowest and write <name>_OPERATIONS.json
+    'memory_stats_file': False,  # measure RSS, Python allocations and live shapes of every stage, print them and write <name>_MEMORY.json (slow)
 }
 
+# BUILD PERFORMANCE settings change how a model is built, never the model itself
+build_settings = [
+    'concurrent_sides', 'primitive_cache_size', 'part_brep_cache', 'union_strategy', 'boolean_parallel',
+    'build_processes', 'stage_cache_dir', 'stage_cache_size_mb', 'build_trace_file',
+    'operation_stats_file', 'memory_stats_file',
+]
+
     ####################################
     ## END CONFIGURATION SECTION
     ####################################
@@ -1,10 +1,61 @@
-import cadquery as cq
-from scipy.spatial import ConvexHull as sphull
+import functools
+import importlib.util
+import sys
+import io
+import multiprocessing
 import numpy as np
 import os
+import pickle
+import time
+import build_trace
+import operation_stats
+import stage_cache
+import transforms
+from collections import OrderedDict
+from itertools import combinations
+from math import comb
+
+
+def _lazy_import(name):
+    # The module is loaded on first attribute access, not here.  cadquery and OCP take
+    # seconds to load, which runs that only configure or plan a build never need.
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named {!r}".format(name), name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# OCP classes are imported in the functions using them: importing any OCP module loads all of OCP
+cq = _lazy_import("cadquery")
 
 debug_trace = False
 
+# Primitives are keyed by their construction parameters and shared between calls.
+# The oldest entries are dropped once the cache holds more than _primitive_cache_size solids.
+_primitive_cache = OrderedDict()
+_primitive_cache_size = 256
+_primitive_cache_stats = {"hits": 0, "misses": 0}
+
+# Imported parts keyed by (path, mtime) of their STEP file.  A BREP copy of every
+# imported part is written next to the STEP file, which loads much faster next time.
+_part_cache = {}
+_part_disk_cache = True
+
+# How union() combines its arguments: "fuse" passes them all to one BOPAlgo fuse, "tree"
+# fuses them pairwise as a balanced tree, "fold" is the old one-at-a-time Workplane.union.
+_union_strategy = "tree"
+_boolean_parallel = True
+
+# Running totals of difference() calls, tools given and tools skipped by the bounding box test.
+_difference_stats = {"cuts": 0, "tools": 0, "skipped": 0}
+_stage_memo = None  # stage key -> result while keep_stages() is on, inherited by forked builds
+
 
 def wp(orient="XY"):
     return cq.Workplane(orient)
@@ -15,35 +66,184 @@ def debugprint(info):
         print(info)
 
 
+def _topology(obj):
+    # (faces, vertices) of the shapes in obj; deferred hulls not built yet count as nothing,
+    # points given as arrays count as vertices
+    if isinstance(obj, (list, tuple)):
+        counts = [_topology(item) for item in obj]
+        return sum(count[0] for count in counts), sum(count[1] for count in counts)
+    if isinstance(obj, PointBox):
+        return 6, 8
+    if isinstance(obj, DeferredHulls):
+        return _topology(obj._shape) if obj._shape is not None else (0, 0)
+    if isinstance(obj, np.ndarray):
+        return 0, len(obj) if obj.ndim == 2 else 1
+    if isinstance(obj, cq.Workplane):
+        return _topology(obj.vals())
+    if isinstance(obj, cq.Shape):
+        return len(obj.Faces()), len(obj.Vertices())
+    return 0, 0
+
+
+def _counted(operation):
+    # func counted in operation_stats under operation, when a count is running
+    def wrap(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not operation_stats.enabled():
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            operation_stats.record(operation, seconds, _topology([args, list(kwargs.values())]), _topology(result))
+            return result
+
+        return wrapper
+
+    return wrap
+
+
+def instance(shape):
+    if isinstance(shape, PointBox):
+        return shape
+    # New Workplane holding located copies of the objects in shape.  The underlying
+    # OCC geometry is shared, so this is far cheaper than rebuilding or copying it.
+    if isinstance(shape, cq.Shape):
+        objects = [shape]
+    else:
+        objects = shape.vals()
+    return cq.Workplane("XY").add([
+        item.moved(cq.Location()) if isinstance(item, cq.Shape) else item for item in objects
+    ])
+
+
+def set_primitive_cache_size(size):
+    global _primitive_cache_size
+    _primitive_cache_size = size
+    while len(_primitive_cache) > max(_primitive_cache_size, 0):
+        _primitive_cache.popitem(last=False)
+
+
+def clear_primitive_cache():
+    _primitive_cache.clear()
+    _primitive_cache_stats["hits"] = 0
+    _primitive_cache_stats["misses"] = 0
+
+
+def primitive_cache_info():
+    return {
+        "hits": _primitive_cache_stats["hits"],
+        "misses": _primitive_cache_stats["misses"],
+        "size": len(_primitive_cache),
+        "max_size": _primitive_cache_size,
+    }
+
+
+def cached_primitive(key, build):
+    solid = _primitive_cache.get(key)
+    if solid is None:
+        _primitive_cache_stats["misses"] += 1
+        solid = build().val()
+        if _primitive_cache_size > 0:
+            _primitive_cache[key] = solid
+            if len(_primitive_cache) > _primitive_cache_size:
+                _primitive_cache.popitem(last=False)
+    else:
+        _primitive_cache_stats["hits"] += 1
+        _primitive_cache.move_to_end(key)
+    return instance(solid)
+
+
 def box(width, height, depth):
-    return cq.Workplane("XY").box(width, height, depth)
+    return cached_primitive(
+        ("box", width, height, depth),
+        lambda: cq.Workplane("XY").box(width, height, depth)
+    )
+
+
+class PointBox:
+    # A box carried as its size and a 4x4 placement.  Hulls read its eight corners straight
+    # from the matrix; the OCC solid is only built (once) when something else needs it.
+    def __init__(self, width, height, depth, matrix=None):
+        self.size = (width, height, depth)
+        self.matrix = transforms.identity() if matrix is None else matrix
+        self._shape = None
+
+    def points(self):
+        half = np.array(self.size, dtype=float) / 2
+        corners = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)]) * half
+        return transforms.apply(self.matrix, corners)
+
+    def placed(self, matrix):
+        return PointBox(*self.size, matrix @ self.matrix)
+
+    def build(self):
+        if self._shape is None:
+            self._shape = transform(box(*self.size), self.matrix)
+        return self._shape
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.build(), name)
+
+
+def point_box(width, height, depth):
+    return PointBox(width, height, depth)
 
 
 def cylinder(radius, height, segments=100):
-    shape = cq.Workplane("XY").union(cq.Solid.makeCylinder(radius=radius, height=height))
-    shape = translate(shape, (0, 0, -height/2))
-    return shape
+    def build():
+        shape = cq.Workplane("XY").union(cq.Solid.makeCylinder(radius=radius, height=height))
+        return shape.translate((0, 0, -height / 2))
+
+    return cached_primitive(("cylinder", radius, height), build)
 
 
 def sphere(radius):
-    return cq.Workplane('XY').union(cq.Solid.makeSphere(radius))
+    return cached_primitive(
+        ("sphere", radius),
+        lambda: cq.Workplane('XY').union(cq.Solid.makeSphere(radius))
+    )
 
 
 def cone(r1, r2, height):
-    return cq.Workplane('XY').union(
-        cq.Solid.makeCone(radius1=r1, radius2=r2, height=height))
+    return cached_primitive(
+        ("cone", r1, r2, height),
+        lambda: cq.Workplane('XY').union(cq.Solid.makeCone(radius1=r1, radius2=r2, height=height))
+    )
+
 
+def location(matrix):
+    from OCP.gp import gp_Trsf
+    matrix = np.asarray(matrix, dtype=float)
+    trsf = gp_Trsf()
+    trsf.SetValues(*matrix[0, :4], *matrix[1, :4], *matrix[2, :4])
+    return cq.Location(trsf)
 
+
+def transform(shape, matrix):
+    # Place shape with a single 4x4 rigid transform, stored as a Location instead of copying geometry.
+    if isinstance(shape, PointBox):
+        return shape.placed(matrix)
+    loc = location(matrix)
+    return shape.newObject([item.moved(loc) if isinstance(item, cq.Shape) else item for item in shape.vals()])
+
+
+# rotate/translate only compose the Location carried by each shape.  OCC applies the
+# accumulated placement once, when the shape reaches a boolean or an export, so long
+# rotate/translate chains no longer copy the geometry at every step.
 def rotate(shape, angle):
-    origin = (0, 0, 0)
-    shape = shape.rotate(axisStartPoint=origin, axisEndPoint=(1, 0, 0), angleDegrees=angle[0])
-    shape = shape.rotate(axisStartPoint=origin, axisEndPoint=(0, 1, 0), angleDegrees=angle[1])
-    shape = shape.rotate(axisStartPoint=origin, axisEndPoint=(0, 0, 1), angleDegrees=angle[2])
-    return shape
+    return transform(shape, transforms.rotation_degrees(angle))
 
 
 def translate(shape, vector):
-    return shape.translate(tuple(vector))
+    return transform(shape, transforms.translation(vector))
+
+
+def place(shape, rotation, position):
+    # rotate then translate, as one placement
+    return transform(shape, transforms.translation(position) @ transforms.rotation_degrees(rotation))
 
 
 def mirror(shape, plane=None):
@@ -51,15 +251,126 @@ def mirror(shape, plane=None):
     return shape.mirror(mirrorPlane=plane)
 
 
+class DeferredHulls:
+    # Convex hulls whose point sets are collected now and built on first use.  union() merges
+    # deferred hulls instead of building them, so all the hulls of connectors(), case_walls()
+    # or a cluster's thumb_connectors()/walls() come out of a single hulls_from_point_sets() call.
+    # Anything else reaching for the geometry builds it through __getattr__.
+    def __init__(self, point_sets, shapes=()):
+        self.point_sets = list(point_sets)
+        self.shapes = list(shapes)
+        self._shape = None
+
+    def build(self):
+        if self._shape is None:
+            self._shape = _build_deferred(self.point_sets, self.shapes)
+        return self._shape
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.build(), name)
+
+
+@_counted("deferred hulls")
+def _build_deferred(point_sets, shapes):
+    items = [*shapes, *hulls_from_point_sets(point_sets)]
+    return _union(items) if items else cq.Workplane('XY')
+
+
+def built(shape):
+    if isinstance(shape, (DeferredHulls, PointBox)):
+        return shape.build()
+    return shape
+
+
+def set_union_strategy(strategy):
+    global _union_strategy
+    if strategy not in ("fuse", "tree", "fold"):
+        raise ValueError("union_strategy must be 'fuse', 'tree' or 'fold', got {!r}".format(strategy))
+    _union_strategy = strategy
+
+
+def set_boolean_parallel(enabled):
+    global _boolean_parallel
+    _boolean_parallel = bool(enabled)
+
+
+def _solids(item):
+    if isinstance(item, cq.Shape):
+        return [item]
+    return [val for val in item.vals() if isinstance(val, cq.Shape)]
+
+
+def _boolean(op, args, tools):
+    # One BOPAlgo run of op with all args against all tools.
+    from OCP.TopTools import TopTools_ListOfShape
+    arg_list = TopTools_ListOfShape()
+    for shape in args:
+        arg_list.Append(shape.wrapped)
+    tool_list = TopTools_ListOfShape()
+    for shape in tools:
+        tool_list.Append(shape.wrapped)
+
+    op.SetArguments(arg_list)
+    op.SetTools(tool_list)
+    op.SetRunParallel(_boolean_parallel)
+    op.Build()
+    if not op.IsDone():
+        # a failed boolean must not pass for an empty or broken solid
+        raise ValueError("{} of {} arguments and {} tools failed".format(type(op).__name__, len(args), len(tools)))
+    return cq.Shape.cast(op.Shape())
+
+
+def _fuse(shapes):
+    from OCP.BRepAlgoAPI import BRepAlgoAPI_Fuse
+    return _boolean(BRepAlgoAPI_Fuse(), shapes[:1], shapes[1:])
+
+
+def _fuse_tree(shapes):
+    # Pairwise fuses of similar sized operands, level by level.
+    while len(shapes) > 1:
+        shapes = [_fuse(shapes[i: i + 2]) if i + 1 < len(shapes) else shapes[i] for i in range(0, len(shapes), 2)]
+    return shapes[0]
+
+
+def _union(shapes):
+    if _union_strategy == "fold":
+        shape = None
+        for item in shapes:
+            if shape is None:
+                shape = item
+            else:
+                shape = shape.union(item)
+        return shape
+
+    if len(shapes) < 2:
+        return shapes[0] if shapes else None
+    with_solids = [item for item in shapes if _solids(item)]
+    if len(with_solids) < 2:
+        return with_solids[0] if with_solids else shapes[0]
+    solids = [solid for item in with_solids for solid in _solids(item)]
+    if _union_strategy == "tree":
+        fused = _fuse_tree(solids)
+    else:
+        fused = _fuse(solids)
+    base = next((item for item in shapes if isinstance(item, cq.Workplane)), cq.Workplane("XY"))
+    return base.newObject([fused.clean()])
+
+
+@_counted("union")
 def union(shapes):
     debugprint('union()')
-    shape = None
-    for item in shapes:
-        if shape is None:
-            shape = item
-        else:
-            shape = shape.union(item)
-    return shape
+    # clusters pass None for parts they leave out
+    shapes = [item for item in shapes if item is not None]
+    deferred = [item for item in shapes if isinstance(item, DeferredHulls) and item._shape is None]
+    if deferred:
+        return DeferredHulls(
+            [pts for item in deferred for pts in item.point_sets],
+            [shp for item in deferred for shp in item.shapes]
+            + [built(item) for item in shapes if not any(item is d for d in deferred)],
+        )
+    return _union([built(item) for item in shapes])
 
 
 def add(shapes):
@@ -67,21 +378,59 @@ def add(shapes):
     shape = None
     for item in shapes:
         if shape is None:
-            shape = item
+            shape = built(item)
         else:
-            shape = shape.add(item)
+            shape = shape.add(built(item))
     return shape
 
 
+def difference_info():
+    return dict(_difference_stats)
+
+
+def _bounding_box(shapes):
+    from OCP.Bnd import Bnd_Box
+    from OCP.BRepBndLib import BRepBndLib
+    bbox = Bnd_Box()
+    for shape in shapes:
+        BRepBndLib.Add_s(shape.wrapped, bbox, True)
+    return bbox
+
+
+@_counted("difference")
 def difference(shape, shapes):
+    # All tools are cut in one boolean.  Tools whose bounding box misses the target's
+    # cannot remove anything and are dropped before OCC sees them.
+    from OCP.BRepAlgoAPI import BRepAlgoAPI_Cut
     debugprint('difference()')
+    shape = built(shape)
+    target = _solids(shape)
+    if not target:
+        return shape
+
+    target_box = _bounding_box(target)
+    tools = []
+    skipped = 0
     for item in shapes:
-        shape = shape.cut(item)
-    return shape
-
-
+        for tool in _solids(built(item)):
+            if _bounding_box([tool]).IsOut(target_box):
+                skipped += 1
+            else:
+                tools.append(tool)
+
+    _difference_stats["cuts"] += 1
+    _difference_stats["tools"] += len(tools) + skipped
+    _difference_stats["skipped"] += skipped
+    if skipped:
+        debugprint('difference(): skipped {} of {} tools'.format(skipped, len(tools) + skipped))
+    if not tools:
+        return shape
+    return shape.newObject([_boolean(BRepAlgoAPI_Cut(), target, tools).clean()])
+
+
+@_counted("intersect")
 def intersect(shape1, shape2):
-    return shape1.intersect(shape2)
+    return built(shape1).intersect(built(shape2))
 
 
 def solidify(shape):
@@ -106,39 +455,272 @@ def face_from_points(points):
     return face
 
 
-def hull_from_points(points):
-    # debugprint('hull_from_points()')
-    hull_calc = sphull(points)
+def order_facet(points, indices, normal, tol=1e-9):
+    # Corners of a convex planar facet counter-clockwise around its outward normal.  Points of the
+    # plane inside the facet or on one of its edges are dropped, only the facet's vertices are kept.
+    corners = points[indices]
+    center = corners.mean(axis=0)
+    u = corners[0] - center
+    u = u - normal * np.dot(u, normal)
+    u = u / np.linalg.norm(u)
+    v = (normal[1] * u[2] - normal[2] * u[1], normal[2] * u[0] - normal[0] * u[2], normal[0] * u[1] - normal[1] * u[0])
+    offsets = corners - center
+    flat = (offsets @ np.array([u, v]).T).tolist()
+    limit = tol * max(1.0, float(np.abs(corners).max())) ** 2
+
+    def turns_left(a, b, c):
+        return (flat[b][0] - flat[a][0]) * (flat[c][1] - flat[a][1]) \
+            - (flat[b][1] - flat[a][1]) * (flat[c][0] - flat[a][0]) > limit
+
+    # monotone chain: the lower chain left to right, then the upper chain back
+    order = sorted(range(len(flat)), key=flat.__getitem__)
+    chain = []
+    for sweep in (order, order[::-1]):
+        start = len(chain)
+        for i in sweep:
+            while len(chain) >= start + 2 and not turns_left(chain[-2], chain[-1], i):
+                chain.pop()
+            chain.append(i)
+        chain.pop()
+    return [int(indices[i]) for i in chain]
+
+
+def hull_facets(hull_calc, tol=1e-9):
+    # Merge neighbouring coplanar Qhull triangles into one polygon per hull facet.
     n_faces = len(hull_calc.simplices)
+    parent = list(range(n_faces))
 
-    faces = []
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    scale = max(1.0, float(np.abs(hull_calc.points).max()))
+    equations = hull_calc.equations
+    for i in range(n_faces):
+        for j in hull_calc.neighbors[i]:
+            if j > i and np.abs(equations[i, :3] - equations[j, :3]).max() <= tol \
+                    and abs(equations[i, 3] - equations[j, 3]) <= tol * scale:
+                parent[find(j)] = find(i)
+
+    groups = {}
     for i in range(n_faces):
-        face_items = hull_calc.simplices[i]
-        fpnts = []
-        for item in face_items:
-            fpnts.append(points[item])
-        faces.append(face_from_points(fpnts))
+        groups.setdefault(find(i), []).append(i)
+
+    facets = []
+    for members in groups.values():
+        indices = np.unique(hull_calc.simplices[members])
+        facets.append(order_facet(hull_calc.points, indices, equations[members[0], :3]))
+    return facets
+
+
+def polyhedron(points, facets):
+    # Build a closed solid from convex planar facets (vertex indices, counter-clockwise seen from outside).
+    # Every vertex and edge is created once and shared by the faces that meet there.
+    from OCP.BRep import BRep_Builder
+    from OCP.BRepBuilderAPI import BRepBuilderAPI_MakeEdge, BRepBuilderAPI_MakeFace, BRepBuilderAPI_MakeVertex
+    from OCP.BRepLib import BRepLib
+    from OCP.TopoDS import TopoDS, TopoDS_Shell, TopoDS_Solid, TopoDS_Wire
+    from OCP.gp import gp_Pnt
+    builder = BRep_Builder()
+    vertices = {}
+    edges = {}
+
+    def vertex(i):
+        if i not in vertices:
+            vertices[i] = BRepBuilderAPI_MakeVertex(gp_Pnt(*[float(c) for c in points[i]])).Vertex()
+        return vertices[i]
+
+    shell = TopoDS_Shell()
+    builder.MakeShell(shell)
+    for facet in facets:
+        wire = TopoDS_Wire()
+        builder.MakeWire(wire)
+        for a, b in zip(facet, facet[1:] + facet[:1]):
+            key = (min(a, b), max(a, b))
+            if key not in edges:
+                edges[key] = BRepBuilderAPI_MakeEdge(vertex(key[0]), vertex(key[1])).Edge()
+            edge = edges[key]
+            builder.Add(wire, edge if a < b else TopoDS.Edge_s(edge.Reversed()))
+        wire.Closed(True)
+        builder.Add(shell, BRepBuilderAPI_MakeFace(wire, True).Face())
+    shell.Closed(True)
+
+    solid = TopoDS_Solid()
+    builder.MakeSolid(solid)
+    builder.Add(solid, shell)
+    BRepLib.OrientClosedSolid_s(solid)
+    return cq.Solid(solid)
+
+
+def sewn_hull(points, hull_calc):
+    # Original per-triangle construction, kept as a fallback for degenerate hulls.
+    faces = []
+    for face_items in hull_calc.simplices:
+        faces.append(face_from_points([points[item] for item in face_items]))
 
     shape = cq.Solid.makeSolid(cq.Shell.makeShell(faces))
-    shape = cq.Workplane('XY').union(shape)
-    return shape
+    return cq.Workplane('XY').union(shape)
 
 
-def hull_from_shapes(shapes, points=None):
-    # debugprint('hull_from_shapes()')
-    vertices = []
-    for shape in shapes:
-        verts = shape.vertices()
-        for vert in verts.objects:
-            vertices.append(np.array(vert.toTuple()))
+@_counted("hull_from_points")
+def hull_from_points(points):
+    # debugprint('hull_from_points()')
+    from scipy.spatial import ConvexHull
+    points = np.asarray(points, dtype=float)
+    hull_calc = ConvexHull(points)
+
+    try:
+        shape = polyhedron(points, hull_facets(hull_calc))
+        if shape.isValid():
+            return cq.Workplane('XY').add(shape)
+    except Exception:
+        pass
+
+    debugprint('hull_from_points() falling back to sewn faces')
+    return sewn_hull(points, hull_calc)
+
+
+# Point sets go through the vectorized batch hull while their hull is found among at most this
+# many of their points, through Qhull otherwise.  The wall braces and bottom hulls of the case
+# are hulls of up to 64 post corners, about 10 to 25 of them vertices.
+_batch_hull_max_points = 32
+# Elements of the (sets, triples, points) distance array of one vectorized pass.
+_batch_hull_pass_size = 2 ** 22
+
+
+def _sphere_directions(count):
+    # count directions spread evenly over the unit sphere (a Fibonacci spiral)
+    k = np.arange(count) + 0.5
+    z = 1 - 2 * k / count
+    phi = np.pi * (3 - np.sqrt(5)) * k
+    r = np.sqrt(1 - z * z)
+    return np.stack([r * np.cos(phi), r * np.sin(phi), z], axis=1)
+
+
+_hull_directions = _sphere_directions(32)
+
+
+def batch_hull_facets(point_sets, tol=1e-9):
+    # Convex hull facets of many small point sets in a few vectorized passes.  Every triple of
+    # candidate points spans a candidate plane; it is a hull facet when no candidate lies outside
+    # of it.  The first candidates are the points farthest out along the _hull_directions; while
+    # other points lie outside of the facets found, the farthest of them join the candidates and
+    # the set goes round again.  Sets with too many candidates or degenerate, flat ones are left
+    # to Qhull.  Returns (unique points, facets) per set, facets being None for those.
+    point_sets = [np.unique(np.asarray(pts, dtype=float).reshape(-1, 3), axis=0) for pts in point_sets]
+    results = [(pts, None) for pts in point_sets]
+    candidates = {}
+    for i, pts in enumerate(point_sets):
+        if len(pts) >= 4:
+            heights = pts @ _hull_directions.T
+            candidates[i] = np.unique(np.concatenate([heights.argmax(axis=0), heights.argmin(axis=0)]))
+
+    while candidates:
+        batch = sorted((i for i, found in candidates.items() if 4 <= len(found) <= _batch_hull_max_points),
+                       key=lambda i: len(candidates[i]))
+        missed = {}
+        # sets of about the same size share a pass, as many as fit with the padding to the largest
+        chunk = []
+        for i in batch:
+            size = len(candidates[i])
+            if chunk and (len(chunk) + 1) * comb(size, 3) * size > _batch_hull_pass_size:
+                missed.update(_batch_hull_chunk_facets(point_sets, candidates, chunk, results, tol))
+                chunk = []
+            chunk.append(i)
+        if chunk:
+            missed.update(_batch_hull_chunk_facets(point_sets, candidates, chunk, results, tol))
+        candidates = {i: np.union1d(candidates[i], extra) for i, extra in missed.items()}
+    return results
+
+
+def _batch_hull_chunk_facets(point_sets, candidates, batch, results, tol):
+    # Facets of the hull of the candidates of each set in batch, stored in results if no point of
+    # the set lies outside of them.  Returns {set: points outside, the farthest one per facet}.
+    size = max(len(candidates[i]) for i in batch)
+    stacked = np.empty((len(batch), size, 3))
+    counts = np.empty(len(batch), dtype=int)
+    for row, i in enumerate(batch):
+        pts = point_sets[i][candidates[i]]
+        counts[row] = len(pts)
+        stacked[row, :len(pts)] = pts
+        stacked[row, len(pts):] = pts[0]  # padding duplicates never change a hull
+
+    triples = np.array(list(combinations(range(size), 3)))
+    a = stacked[:, triples[:, 0]]
+    normals = np.cross(stacked[:, triples[:, 1]] - a, stacked[:, triples[:, 2]] - a)
+    lengths = np.linalg.norm(normals, axis=2)
+    scale = np.maximum(1.0, np.abs(stacked).max(axis=(1, 2)))[:, None]
+    usable = lengths > tol * scale * scale
+    normals = normals / np.where(usable, lengths, 1.0)[:, :, None]
+
+    # signed distance of every point to every candidate plane: (sets, triples, points)
+    offsets = np.einsum('bcx,bcx->bc', normals, a)
+    distances = normals @ stacked.transpose(0, 2, 1) - offsets[:, :, None]
+    limit = tol * scale[:, :, None]
+    below = (distances <= limit).all(axis=2)
+    above = (distances >= -limit).all(axis=2)
+    on_plane = np.abs(distances) <= limit
+
+    missed = {}
+    for row, i in enumerate(batch):
+        pts = point_sets[i]
+        found = usable[row] & (below[row] ^ above[row])
+        # every triple of a facet's points spans the same plane, one of them is enough
+        planes, first = np.unique(on_plane[row, found, :counts[row]], axis=0, return_index=True)
+        if len(planes) < 4:
+            continue  # flat candidates
+        facet_triples = np.nonzero(found)[0][first]
+        outward = normals[row, facet_triples] * np.where(below[row, facet_triples], 1.0, -1.0)[:, None]
+        outside = pts @ outward.T - offsets[row, facet_triples] * np.where(below[row, facet_triples], 1.0, -1.0)
+        violated = (outside > tol * scale[row, 0]).any(axis=0)
+        if violated.any():
+            missed[i] = np.unique(outside[:, violated].argmax(axis=0))
+        else:
+            results[i] = (pts, [order_facet(pts, candidates[i][np.nonzero(plane)[0]], normal)
+                                for plane, normal in zip(planes, outward)])
+    return missed
+
+
+def hulls_from_point_sets(point_sets):
+    hulls = []
+    for pts, facets in batch_hull_facets(point_sets):
+        shape = None
+        if facets is not None:
+            try:
+                shape = polyhedron(pts, facets)
+                if not shape.isValid():
+                    shape = None
+            except Exception:
+                shape = None
+        if shape is None:
+            hulls.append(hull_from_points(pts))
+        else:
+            hulls.append(cq.Workplane('XY').add(shape))
+    return hulls
+
+
+def hull_points(shapes, points=None):
+    vertices = [shape_points(shape) for shape in shapes]
     if points is not None:
-        for point in points:
-            vertices.append(np.array(point))
+        vertices.append(np.asarray(points, dtype=float).reshape(-1, 3))
+    return np.concatenate(vertices) if vertices else np.empty((0, 3))
 
-    shape = hull_from_points(vertices)
-    return shape
+
+def shape_points(shape):
+    if isinstance(shape, PointBox):
+        return shape.points()
+    return np.array([vert.toTuple() for vert in shape.vertices().objects], dtype=float).reshape(-1, 3)
 
 
+@_counted("hull_from_shapes")
+def hull_from_shapes(shapes, points=None):
+    # debugprint('hull_from_shapes()')
+    return DeferredHulls([hull_points(shapes, points)])
+
+
+@_counted("tess_hull")
 def tess_hull(shapes, sl_tol=.5, sl_angTol=1):
     # debugprint('hull_from_shapes()')
     vertices = []
@@ -156,43 +738,20 @@ def tess_hull(shapes, sl_tol=.5, sl_angTol=1):
     return shape
 
 
+@_counted("triangle_hulls")
 def triangle_hulls(shapes):
     debugprint('triangle_hulls()')
-    hulls = [cq.Workplane('XY')]
-    for i in range(len(shapes) - 2):
-        hulls.append(hull_from_shapes(shapes[i: (i + 3)]))
-
-    return union(hulls)
+    return DeferredHulls([hull_points(shapes[i: (i + 3)]) for i in range(len(shapes) - 2)])
 
 
+@_counted("bottom_hull")
 def bottom_hull(p, height=0.001):
+    # Hull of every point of p together with its projection onto z = -10, built in one go.
     debugprint("bottom_hull()")
-    shape = None
-    for item in p:
-        vertices = []
-        # verts = item.faces('<Z').vertices()
-        verts = item.faces().vertices()
-        for vert in verts.objects:
-            v0 = vert.toTuple()
-            v1 = [v0[0], v0[1], -10]
-            vertices.append(np.array(v0))
-            vertices.append(np.array(v1))
-
-        t_shape = hull_from_points(vertices)
-
-        # t_shape = translate(t_shape, [0, 0, height / 2 - 10])
-
-        if shape is None:
-            shape = t_shape
-
-        for shp in (*p, shape, t_shape):
-            try:
-                shp.vertices()
-            except:
-                0
-        shape = union([shape, hull_from_shapes((shape, t_shape))])
-
-    return shape
+    points = np.concatenate([shape_points(item) for item in p])
+    floor = points.copy()
+    floor[:, 2] = -10
+    return DeferredHulls([np.concatenate([points, floor])])
 
 
 def polyline(point_list):
@@ -220,20 +779,217 @@ def soften(shape, mm=0.5):
     return shape.edges().fillet(mm)
 
 
+def set_part_disk_cache(enabled):
+    global _part_disk_cache
+    _part_disk_cache = enabled
+
+
+def _read_part_cache(cache_file):
+    if hasattr(cq.Shape, "importBin"):
+        return cq.Shape.importBin(cache_file)
+    return cq.Shape.importBrep(cache_file)
+
+
+def _write_part_cache(shape, cache_file):
+    # written aside and moved into place, so processes importing the same part at once
+    # never read a half-written file
+    partial = "{}.{}.tmp".format(cache_file, os.getpid())
+    try:
+        if hasattr(shape, "exportBin"):
+            shape.exportBin(partial)
+        else:
+            shape.exportBrep(partial)
+        os.replace(partial, cache_file)
+    except Exception as err:
+        # parts directory may be read only, the in-memory cache still applies
+        print("UNABLE TO WRITE PART CACHE {}: {}".format(cache_file, err))
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def _load_part(step_file):
+    cache_file = os.path.splitext(step_file)[0] + ".brep"
+    if _part_disk_cache and os.path.isfile(cache_file) \
+            and os.path.getmtime(cache_file) >= os.path.getmtime(step_file):
+        print("IMPORTING FROM {}".format(cache_file))
+        try:
+            return _read_part_cache(cache_file)
+        except Exception as err:
+            print("UNABLE TO READ PART CACHE {}: {}".format(cache_file, err))
+
+    print("IMPORTING FROM {}".format(step_file))
+    objects = cq.importers.importShape(cq.exporters.ExportTypes.STEP, step_file).vals()
+    shape = objects[0] if len(objects) == 1 else cq.Compound.makeCompound(objects)
+    if _part_disk_cache:
+        _write_part_cache(shape, cache_file)
+    return shape
+
+
+@_counted("import_file")
 def import_file(fname, convexity=None):
-    print("IMPORTING FROM {}".format(fname))
-    return cq.Workplane('XY').add(cq.importers.importShape(
-        cq.exporters.ExportTypes.STEP,
-        fname + ".step"))
+    step_file = os.path.abspath(fname + ".step")
+    key = (step_file, os.path.getmtime(step_file))
+    shape = _part_cache.get(key)
+    if shape is None:
+        shape = _load_part(step_file)
+        _part_cache[key] = shape
+    return instance(shape)
+
+
+def clear_part_cache():
+    # imported parts are read again, from the BREP copies if there are any
+    _part_cache.clear()
+
+
+def serialize_shape(shape):
+    # BREP bytes of every shape in the Workplane, for sending a result between processes.
+    vals = [val for val in built(shape).vals() if isinstance(val, cq.Shape)]
+    single = len(vals) == 1
+    stream = io.BytesIO()
+    (vals[0] if single else cq.Compound.makeCompound(vals)).exportBrep(stream)
+    return single, stream.getvalue()
+
 
+def deserialize_shape(data):
+    single, brep = data
+    shape = cq.Shape.importBrep(io.BytesIO(brep))
+    return cq.Workplane('XY').newObject([shape] if single else list(shape))
+
+
+# Tasks of the current build_parallel() call.  Workers are forked after this is filled in,
+# so they find the (unpicklable) closures here by name.
+_parallel_tasks = {}
+
+
+def _run_parallel_task(name):
+    shape = _parallel_tasks[name]()
+    operation_stats.flush()
+    return serialize_shape(shape), _stage_key(shape)
+
+
+def build_parallel(tasks, processes=0):
+    # Build independent shapes, given as name -> zero-argument callable, in forked worker
+    # processes and return name -> shape.  processes=0 uses every core, 1 builds in sequence,
+    # as does a call made inside a worker (daemonic processes cannot have children).
+    processes = processes or os.cpu_count() or 1
+    if (processes == 1 or len(tasks) < 2 or multiprocessing.current_process().daemon
+            or "fork" not in multiprocessing.get_all_start_methods()):
+        return {name: task() for name, task in tasks.items()}
+
+    _parallel_tasks.update(tasks)
+    try:
+        with multiprocessing.get_context("fork").Pool(min(processes, len(tasks))) as pool:
+            results = pool.map(_run_parallel_task, list(tasks), chunksize=1)
+    finally:
+        _parallel_tasks.clear()
+    shapes = {}
+    for name, (data, key) in zip(tasks, results):
+        shapes[name] = deserialize_shape(data)
+        if key is not None:
+            shapes[name]._stage_key = key
+    return shapes
+
+
+def set_stage_cache(directory, max_megabytes, ignored=()):
+    stage_cache.configure(directory, max_megabytes, ignored)
+
+
+def keep_stages(enabled=True):
+    # Keep every stage built from here on in memory, starting empty.  Processes forked
+    # afterwards reuse the ones their configuration also needs instead of rebuilding them.
+    global _stage_memo
+    _stage_memo = {} if enabled else None
+
+
+def stage_cache_info():
+    return stage_cache.info()
+
+
+def live_shapes():
+    # cadquery Shapes alive in this process, each holding an OCC shape handle
+    import gc
+    return sum(1 for item in gc.get_objects() if isinstance(item, cq.Shape))
+
+
+def _stage_key(shape):
+    # vars() rather than getattr(): deferred shapes would build themselves to answer getattr
+    return vars(shape).get("_stage_key") if hasattr(shape, "__dict__") else None
+
+
+def stage_key(name, build, *args, depends=(), **kwargs):
+    # The key cached() stores build(*args, **kwargs) under, None if it would not be cached.
+    # depends: functions and objects the result depends on besides build, such as the stages it calls.
+    # Shape arguments without a key (not from a stage), and arguments the key cannot take in
+    # (see stage_cache.keyable()), make the call uncacheable.
+    if not stage_cache.enabled() and _stage_memo is None:
+        return None
+
+    inputs = []
+    for arg in (*args, *kwargs.values()):
+        if isinstance(arg, (cq.Workplane, cq.Shape, DeferredHulls, PointBox)):
+            key = _stage_key(arg)
+            if key is None:
+                return None
+            arg = ("stage", key)
+        elif not stage_cache.keyable(arg):
+            return None
+        inputs.append(arg)
+    return stage_cache.fingerprint(name, build, inputs, list(kwargs), list(depends), stage_cache.parts_state())
+
+
+def stage_cached(key):
+    return key is not None and stage_cache.contains(key)
+
+
+def cached(name, build, *args, depends=(), **kwargs):
+    # build(*args, **kwargs) through the on-disk stage cache.  The result, a shape or a tuple of
+    # shapes, remembers its key so later stages that take it as an input can be keyed as well.
+    key = stage_key(name, build, *args, depends=depends, **kwargs)
+    if key is None:
+        return build(*args, **kwargs)
+    if _stage_memo is not None and key in _stage_memo:
+        print("REUSING STAGE {} FROM MEMORY".format(name))
+        return _stage_memo[key]
+
+    data = stage_cache.load(key) if stage_cache.enabled() else None
+    if data is not None:
+        print("LOADING STAGE {} FROM CACHE".format(name))
+        with build_trace.span("load stage " + name):
+            stored = pickle.loads(data)
+            kind = stored["kind"]
+            items = [None if item is None else deserialize_shape(item) for item in stored["items"]]
+    else:
+        result = build(*args, **kwargs)
+        kind = type(result).__name__ if isinstance(result, (tuple, list)) else "shape"
+        items = [result] if kind == "shape" else list(result)
+        if stage_cache.enabled():
+            stored = {"kind": kind, "items": [None if item is None else serialize_shape(item) for item in items]}
+            stage_cache.store(key, pickle.dumps(stored))
+
+    for i, item in enumerate(items):
+        if item is not None:
+            item._stage_key = key if kind == "shape" else "{}:{}".format(key, i)
+    if kind == "shape":
+        result = items[0]
+    else:
+        result = tuple(items) if kind == "tuple" else items
+    if _stage_memo is not None:
+        _stage_memo[key] = result
+    return result
+
+
+@_counted("export_stl")
 def export_stl(shape, fname):
     print("EXPORTING STL TO {}".format(fname))
-    cq.exporters.export(shape, fname=fname + "_cadquery.stl", exportType="STL")
+    with build_trace.span("export_stl", file=os.path.basename(fname)):
+        cq.exporters.export(built(shape), fname=fname + "_cadquery.stl", exportType="STL")
 
+@_counted("export_file")
 def export_file(shape, fname):
     print("EXPORTING TO {}".format(fname))
-    cq.exporters.export(w=shape, fname=fname + ".step",
-                        exportType='STEP')
+    with build_trace.span("export_file", file=os.path.basename(fname)):
+        cq.exporters.export(w=built(shape), fname=fname + ".step",
+                            exportType='STEP')
 
     export_stl(shape, fname)
 
@@ -269,10 +1025,12 @@ def get_puck_base():
     return puck_base
 
 
+@_counted("export_dxf")
 def export_dxf(shape, fname):
     print("EXPORTING TO {}".format(fname))
-    cq.exporters.export(w=shape, fname=fname + ".dxf",
-                        exportType='DXF')
+    with build_trace.span("export_dxf", file=os.path.basename(fname)):
+        cq.exporters.export(w=built(shape), fname=fname + ".dxf",
+                            exportType='DXF')
 
 def mount_plate():
     height = 7.0
@@ -283,9 +1041,7 @@ def mount_plate():
         .circle(12)
         .loft(combine=True)
     )
-    os.path.abspath(os.path.join(r"src", "parts"))
-
-    screw = cq.importers.importStep(os.path.abspath(os.path.join(r"src", "parts", "quarter_inch_screw.step"))).translate([0, 0, -8])
+    screw = import_file(os.path.abspath(os.path.join(r"src", "parts", "quarter_inch_screw"))).translate([0, 0, -8])
 
     return result.cut(screw)  # .translate([0, 0, height / 2.0])
 
@@ -482,8 +1238,8 @@ pcb_v3 = {
 
 def usb_c_cut_shape(width, height, depth):
     shape = box(width, depth, height)
-    cyl1 = translate(rotate(cylinder(height / 2, depth), (90, 0, 0)), (width / 2, 0, 0))
-    cyl2 = translate(rotate(cylinder(height / 2, depth), (90, 0, 0)), (-width / 2, 0, 0))
+    cyl1 = place(cylinder(height / 2, depth), (90, 0, 0), (width / 2, 0, 0))
+    cyl2 = place(cylinder(height / 2, depth), (90, 0, 0), (-width / 2, 0, 0))
     return union([shape, cyl1, cyl2])
 
 
@@ -1,6 +1,8 @@
 import solid as sl
+import numpy as np
 from subprocess import run
 import os
+import build_trace
 
 debug_trace = False
 
@@ -12,6 +14,10 @@ def box(width, height, depth):
     return sl.cube([width, height, depth], center=True)
 
 
+def point_box(width, height, depth):
+    return box(width, height, depth)
+
+
 def cylinder(radius, height, segments=100):
     return sl.cylinder(r=radius, h=height, segments=segments, center=True)
 
@@ -28,6 +34,10 @@ def solidify(shape):
     return shape
 
 
+def instance(shape):
+    return shape
+
+
 def rotate(shape, angle):
     return sl.rotate(angle)(shape)
 
@@ -36,6 +46,14 @@ def translate(shape, vector):
     return sl.translate(tuple(vector))(shape)
 
 
+def transform(shape, matrix):
+    return sl.multmatrix(np.asarray(matrix, dtype=float).tolist())(shape)
+
+
+def place(shape, rotation, position):
+    return translate(rotate(shape, rotation), position)
+
+
 def mirror(shape, plane=None):
     debugprint('mirror()')
     planes = {
@@ -146,13 +164,42 @@ def import_file(fname, convexity=4):
     return sl.import_stl(full_name, convexity=convexity)
 
 
+def build_parallel(tasks, processes=0):
+    # OpenSCAD objects are only assembled in Python, nothing to gain from more processes
+    return {name: task() for name, task in tasks.items()}
+
+
+def cached(name, build, *args, depends=(), **kwargs):
+    # the stage cache stores BREP, which only the cadquery engine produces
+    return build(*args, **kwargs)
+
+
+def keep_stages(enabled=True):
+    pass
+
+
+def stage_key(name, build, *args, depends=(), **kwargs):
+    return None
+
+
+def stage_cached(key):
+    return False
+
+
+def live_shapes():
+    # OpenSCAD objects hold no kernel shapes
+    return None
+
+
 def export_file(shape, fname):
     print("EXPORTING TO {}".format(fname))
-    sl.scad_render_to_file(shape, fname + ".scad")
+    with build_trace.span("export_file", file=os.path.basename(fname)):
+        sl.scad_render_to_file(shape, fname + ".scad")
 
 def export_stl(shape, fname):
     print("EXPORTING STL TO {}".format(fname))
-    run(["C:\\Program Files\\OpenSCAD\\openscad.com", "-o",  fname + "_openscad.stl", fname + ".scad"])
+    with build_trace.span("export_stl", file=os.path.basename(fname)):
+        run(["C:\\Program Files\\OpenSCAD\\openscad.com", "-o",  fname + "_openscad.stl", fname + ".scad"])
 
 
 def export_dxf(shape, fname):
@@ -2,13 +2,9 @@ import json
 import os
 
 
-def load_json(filepath, save_path='../things'):
-    with open('./src/run_config.json') as fid:
-        main_json = json.load(fid)
-
-    with open(filepath, mode='r') as fid:
-        first_data = json.load(fid)
-
+def merge_config(first_data, main_json):
+    # Apply first_data over main_json: "file:" values pull in a child json from src/json first,
+    # then first_data's own values override everything.
     for key in first_data:
         value = str(first_data[key])
         if value.startswith("file:"):
@@ -28,4 +24,11 @@ def load_json(filepath, save_path='../things'):
     return main_json
 
 
+def load_json(filepath, save_path='../things'):
+    with open('./src/run_config.json') as fid:
+        main_json = json.load(fid)
+
+    with open(filepath, mode='r') as fid:
+        first_data = json.load(fid)
 
+    return merge_config(first_data, main_json)
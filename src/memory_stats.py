@@ -0,0 +1,176 @@
+import functools
+import json
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+
+# Memory used by each stage of a build: resident size of the process and Python allocations
+# (tracemalloc) when the stage starts and ends, the Python peak within it, and the number of
+# live shapes, each holding an OCC shape handle, as counted by the engine's live_shapes().
+#
+# Like the build trace, every process of the build appends its stages to its own file next to
+# the report as each one ends; finish() in the process that started the measurement merges
+# them, prints one line per stage and writes them all as JSON.  Tracing Python allocations
+# slows a build down noticeably, this is for finding out where the memory goes.  Resident sizes
+# come from the OS on Linux and other Unixes; on Windows they need psutil, else they are left out.
+
+_path = None
+_parts = None
+_owner = None
+_live_shapes = None
+_peaks = []  # Python peak so far of each stage being measured, innermost last
+
+
+def start(path, live_shapes=None):
+    # live_shapes: callable returning the number of live shapes, or None where it cannot tell
+    global _path, _parts, _owner, _live_shapes
+    _path = path
+    _parts = path + ".parts"
+    _owner = os.getpid()
+    _live_shapes = live_shapes
+    shutil.rmtree(_parts, ignore_errors=True)
+    os.makedirs(_parts, exist_ok=True)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def enabled():
+    return _parts is not None
+
+
+def _psutil_memory():
+    # psutil is optional, it only fills in what the OS cannot be asked for directly
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info()
+
+
+def _rss_mb():
+    # current resident size: /proc on Linux, psutil elsewhere if installed, else unknown
+    try:
+        with open("/proc/self/statm") as fid:
+            return int(fid.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    memory = _psutil_memory()
+    return memory.rss / 2 ** 20 if memory is not None else None
+
+
+def _peak_rss_mb():
+    # peak resident size of this process: getrusage() on Unix, psutil on Windows, else unknown
+    try:
+        import resource
+    except ImportError:
+        memory = _psutil_memory()
+        peak = getattr(memory, "peak_wset", None)
+        return peak / 2 ** 20 if peak is not None else None
+    # ru_maxrss is in kilobytes, on macOS in bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024.0
+
+
+def _snapshot():
+    return {
+        "rss_mb": _rss_mb(),
+        "python_mb": tracemalloc.get_traced_memory()[0] / 2 ** 20,
+        "shapes": _live_shapes() if _live_shapes is not None else None,
+    }
+
+
+class stage:
+    # with stage("model_side", side="right"): ...
+    def __init__(self, name, **args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        if _parts is not None:
+            self.before = _snapshot()
+            # the enclosing stage keeps its peak so far, this one starts counting from now
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], tracemalloc.get_traced_memory()[1])
+            _peaks.append(0)
+            tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc):
+        if _parts is not None and hasattr(self, "before"):
+            peak = max(_peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if _peaks:
+                _peaks[-1] = max(_peaks[-1], peak)
+            after = _snapshot()
+            record = {
+                "stage": self.name,
+                "args": self.args,
+                "pid": os.getpid(),
+                "ended": time.time(),
+                "start": self.before,
+                "end": after,
+                "python_peak_mb": peak / 2 ** 20,
+                "process_peak_rss_mb": _peak_rss_mb(),
+            }
+            with open(os.path.join(_parts, "{}.jsonl".format(os.getpid())), "a") as fid:
+                fid.write(json.dumps(record) + "\n")
+        return False
+
+
+def measured(func, name=None):
+    # func measured as a stage named after it, with its plain keyword arguments (side=...) as arguments
+    name = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _parts is None:
+            return func(*args, **kwargs)
+        with stage(name, **{k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool))}):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _mb(value):
+    return "" if value is None else "{:.0f}".format(value)
+
+
+def _change(record, field, form):
+    start, end = record["start"][field], record["end"][field]
+    return "" if start is None or end is None else form.format(end - start)
+
+
+def finish():
+    global _path, _parts, _owner, _live_shapes
+    if _parts is None or os.getpid() != _owner:
+        return None
+
+    records = []
+    for name in sorted(os.listdir(_parts)):
+        with open(os.path.join(_parts, name)) as fid:
+            records.extend(json.loads(line) for line in fid)
+    records.sort(key=lambda record: record["ended"])
+
+    with open(_path, "w") as fid:
+        json.dump(records, fid, indent=2)
+    shutil.rmtree(_parts, ignore_errors=True)
+
+    print()
+    print("MEMORY PER STAGE (MB; stages are listed as they end, in every process, nested stages before their parent)")
+    print("{:>7} {:>7} {:>7} {:>8} {:>8} {:>8} {:>7} {:>7}  {:<10} {}".format(
+        "RSS", "change", "peak", "python", "change", "py peak", "shapes", "change", "process", "stage"))
+    for record in records:
+        process = "build" if record["pid"] == _owner else str(record["pid"])
+        label = " ".join([record["stage"]] + ["{}={}".format(k, v) for k, v in record["args"].items()])
+        print("{:>7} {:>7} {:>7} {:>8.1f} {:>8} {:>8.1f} {:>7} {:>7}  {:<10} {}".format(
+            _mb(record["end"]["rss_mb"]), _change(record, "rss_mb", "{:+.0f}"), _mb(record["process_peak_rss_mb"]),
+            record["end"]["python_mb"], _change(record, "python_mb", "{:+.1f}"), record["python_peak_mb"],
+            "" if record["end"]["shapes"] is None else record["end"]["shapes"], _change(record, "shapes", "{:+d}"),
+            process, label))
+    print("WROTE MEMORY REPORT TO {}".format(_path))
+
+    path = _path
+    _path = _parts = _owner = _live_shapes = None
+    tracemalloc.stop()
+    return path
@@ -1,6 +1,8 @@
 import os
 import copy
-import importlib
+import getopt
+import sys
+import bulk_engine
 from generate_configuration import *
 
 
@@ -79,30 +81,37 @@ def create_config(config_options):
 
 
 
-def build_release(base, configurations, engines=('solid', 'cadquery')):
-    init = True
+def build_release(base, configurations, engines=('solid', 'cadquery'), jobs=0, fork=False):
+    # every configuration and engine is built in its own worker process, `jobs` at a time
+    builds = []
     for config in configurations:
-        shape_config = copy.deepcopy(base)
-        for item in config:
-            shape_config[item] = config[item]
-    
         for engine in engines:
+            shape_config = copy.deepcopy(base)
+            for item in config:
+                shape_config[item] = config[item]
             shape_config['ENGINE'] = engine
-            with open('run_config.json', mode='w') as fid:
-                json.dump(shape_config, fid, indent=4)
-    
-            if init:
-                import dactyl_manuform as dactyl_manuform
-                dactyl_manuform.run()
-                init = False
-            else:
-                importlib.reload(dactyl_manuform)
-                dactyl_manuform.run()
+            shape_config['overrides'] = ""
+            builds.append(shape_config)
+
+    if fork:
+        return bulk_engine.build_forked(builds, jobs)
+    return bulk_engine.build_all(builds, jobs)
+
 
 if __name__ == '__main__':
+    opts, args = getopt.getopt(sys.argv[1:], "", ["jobs=", "fork"])
+    jobs = 0
+    fork = False
+    for opt, arg in opts:
+        if opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--fork":
+            fork = True
+
     configurations = create_config(config_options)
 
     ENGINES = ['solid', 'cadquery']
     # ENGINES = ['solid']
 
-    build_release(base, configurations, ENGINES)
+    results = build_release(base, configurations, ENGINES, jobs, fork)
+    sys.exit(1 if bulk_engine.report(results) else 0)
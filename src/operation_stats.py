@@ -0,0 +1,123 @@
+import json
+import os
+import shutil
+import sys
+
+# Counts of the geometry kernel operations of a build, by operation and by the builder
+# function that asked for it: how often, how long (inclusive of nested operations) and how many
+# faces and vertices went in and came out.
+#
+# Every process of the build keeps its own table, flushed to a file next to the report by
+# flush() once its work is done; finish() in the process that started the count adds them up,
+# prints the most expensive call sites and writes them all as JSON.
+
+_path = None
+_parts = None
+_owner = None
+_table = {}  # (operation, call site) -> [count, seconds, faces in, vertices in, faces out, vertices out]
+
+# frames in these files are helpers, the call site is the first frame outside them
+_helper_files = {"helpers_cadquery.py", "helpers_solid.py", "operation_stats.py", "build_trace.py", "stage_cache.py"}
+
+
+def _forget_parent():
+    # a forked process counts only its own operations, its parent reports the rest
+    _table.clear()
+
+
+# Windows has no fork(), and no register_at_fork()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_parent)
+
+
+def start(path):
+    global _path, _parts, _owner
+    _path = path
+    _parts = path + ".parts"
+    _owner = os.getpid()
+    _table.clear()
+    shutil.rmtree(_parts, ignore_errors=True)
+    os.makedirs(_parts, exist_ok=True)
+
+
+def enabled():
+    return _parts is not None
+
+
+def call_site():
+    frame = sys._getframe(1)
+    while frame is not None and os.path.basename(frame.f_code.co_filename) in _helper_files:
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name).replace(".<locals>", "")
+    return "{} ({}:{})".format(name, os.path.basename(code.co_filename), frame.f_lineno)
+
+
+def record(operation, seconds, topology_in, topology_out):
+    row = _table.setdefault((operation, call_site()), [0, 0.0, 0, 0, 0, 0])
+    row[0] += 1
+    row[1] += seconds
+    row[2] += topology_in[0]
+    row[3] += topology_in[1]
+    row[4] += topology_out[0]
+    row[5] += topology_out[1]
+
+
+def _rows(table):
+    return [{
+        "operation": operation,
+        "call_site": site,
+        "count": row[0],
+        "seconds": row[1],
+        "faces_in": row[2],
+        "vertices_in": row[3],
+        "faces_out": row[4],
+        "vertices_out": row[5],
+    } for (operation, site), row in table.items()]
+
+
+def flush():
+    # this process's table so far, for finish() to pick up
+    if _parts is not None and os.getpid() != _owner:
+        with open(os.path.join(_parts, "{}.json".format(os.getpid())), "w") as fid:
+            json.dump(_rows(_table), fid)
+
+
+def finish(top=25):
+    global _path, _parts, _owner
+    if _parts is None or os.getpid() != _owner:
+        return None
+
+    totals = {}
+    tables = [_rows(_table)]
+    for name in sorted(os.listdir(_parts)):
+        with open(os.path.join(_parts, name)) as fid:
+            tables.append(json.load(fid))
+    for rows in tables:
+        for row in rows:
+            key = (row["operation"], row["call_site"])
+            total = totals.setdefault(key, dict(row, count=0, seconds=0.0, faces_in=0, vertices_in=0,
+                                                faces_out=0, vertices_out=0))
+            for field in ["count", "seconds", "faces_in", "vertices_in", "faces_out", "vertices_out"]:
+                total[field] += row[field]
+    rows = sorted(totals.values(), key=lambda row: -row["seconds"])
+
+    with open(_path, "w") as fid:
+        json.dump(rows, fid, indent=2)
+    shutil.rmtree(_parts, ignore_errors=True)
+
+    print()
+    print("OPERATIONS, the {} slowest call sites of {} (seconds include nested operations)".format(min(top, len(rows)), len(rows)))
+    print("{:>9} {:>7} {:>10} {:>10} {:>10} {:>10}  {:<16} {}".format(
+        "seconds", "count", "faces in", "faces out", "verts in", "verts out", "operation", "call site"))
+    for row in rows[:top]:
+        print("{seconds:>9.2f} {count:>7} {faces_in:>10} {faces_out:>10} {vertices_in:>10} {vertices_out:>10}  "
+              "{operation:<16} {call_site}".format(**row))
+    print("WROTE OPERATION COUNTS TO {}".format(_path))
+
+    path = _path
+    _path = _parts = _owner = None
+    _table.clear()
+    return path
@@ -0,0 +1,305 @@
+import hashlib
+import os
+import sys
+import types
+
+import numpy as np
+
+# On-disk cache of build stages, keyed by content.
+#
+# A stage key is a hash of everything the stage function can read: the code of every function
+# reachable from it (through closures, globals and cluster methods), the values of the config
+# parameters and derived settings those functions refer to, and the keys of the staged shapes
+# it is given.  Changing a parameter only invalidates the stages that actually read it.
+#
+# Entries are plain files named after their key.  Loading one refreshes its modification
+# time, and the least recently used entries are deleted once the cache outgrows its limit.
+
+_src_dir = os.path.dirname(os.path.abspath(__file__))
+
+_cache_dir = None
+_max_bytes = 0
+_ignored = frozenset()
+_stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+_code_digests = {}
+_source_digests = {}
+_parts_state = None
+
+
+def configure(directory, max_megabytes, ignored=()):
+    # max_megabytes of 0 turns the cache off.  ignored: names of settings that change how a
+    # stage is built but not the result, left out of every key.
+    global _cache_dir, _max_bytes, _ignored
+    _cache_dir = os.path.abspath(directory) if directory not in ["", None] else None
+    _max_bytes = int(max_megabytes * 1024 * 1024) if max_megabytes else 0
+    _ignored = frozenset(ignored)
+
+
+def enabled():
+    return _cache_dir is not None and _max_bytes > 0
+
+
+def info():
+    return dict(_stats)
+
+
+def _entry(key):
+    return os.path.join(_cache_dir, key + ".stage")
+
+
+def load(key):
+    entry = _entry(key)
+    try:
+        with open(entry, "rb") as fid:
+            data = fid.read()
+    except OSError:
+        _stats["misses"] += 1
+        return None
+    os.utime(entry)
+    _stats["hits"] += 1
+    return data
+
+
+def contains(key):
+    return enabled() and os.path.isfile(_entry(key))
+
+
+def store(key, data):
+    os.makedirs(_cache_dir, exist_ok=True)
+    entry = _entry(key)
+    partial = "{}.{}.tmp".format(entry, os.getpid())
+    with open(partial, "wb") as fid:
+        fid.write(data)
+    os.replace(partial, entry)
+    evict()
+
+
+def evict():
+    entries = []
+    for name in os.listdir(_cache_dir):
+        if name.endswith(".stage"):
+            try:
+                stat = os.stat(os.path.join(_cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= _max_bytes:
+            break
+        try:
+            os.remove(os.path.join(_cache_dir, name))
+        except OSError:
+            continue
+        total -= size
+        _stats["evicted"] += 1
+
+
+def parts_state():
+    # Imported STEP parts are files, not code: their names, sizes and times go into every key.
+    global _parts_state
+    if _parts_state is None:
+        parts = os.path.join(_src_dir, "parts")
+        _parts_state = []
+        for name in sorted(os.listdir(parts)) if os.path.isdir(parts) else []:
+            if name.lower().endswith(".step"):
+                stat = os.stat(os.path.join(parts, name))
+                _parts_state.append((name, stat.st_size, stat.st_mtime))
+    return _parts_state
+
+
+def fingerprint(*objects):
+    digest = hashlib.sha256()
+    seen = set()
+    for obj in objects:
+        _feed(obj, digest, seen)
+    return digest.hexdigest()
+
+
+class _Names:
+    # Stands in for the hash when only the names a stage refers to are wanted.
+    def __init__(self):
+        self.names = set()
+
+    def update(self, data):
+        pass
+
+
+def referenced_names(*objects):
+    # Global and closure names read by everything reachable from objects, the walk fingerprint() does.
+    names = _Names()
+    seen = set()
+    for obj in objects:
+        _feed(obj, names, seen)
+    return names.names
+
+
+def keyable(value):
+    # True when fingerprint() takes in everything of value that a stage could read: plain data,
+    # code, and objects of project classes such as the clusters.  Anything else, memo tables or
+    # objects of other libraries, is hashed by its type alone.
+    if _is_data(value) or isinstance(value, (types.FunctionType, types.MethodType, types.ModuleType, type)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(keyable(item) for item in value)
+    return not isinstance(value, dict) and hasattr(value, "__dict__") and _in_project(type(value).__module__)
+
+
+def _feed_name(name, digest):
+    digest.update(name.encode())
+    if isinstance(digest, _Names):
+        digest.names.add(name)
+
+
+def _is_data(value):
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes, np.number, np.bool_, np.ndarray)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_data(item) for item in value)
+    if isinstance(value, dict):
+        # dicts keyed by anything but strings are memo tables (plate_cache, key_transforms), not settings;
+        # an empty one is a table too, or its key would change as soon as the build fills it
+        return bool(value) and all(isinstance(k, str) and _is_data(v) for k, v in value.items())
+    return False
+
+
+def _feed_data(value, digest):
+    if isinstance(value, np.ndarray):
+        digest.update("array{}{}".format(value.dtype, value.shape).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update("{}[{}".format(type(value).__name__, len(value)).encode())
+        for item in value:
+            _feed_data(item, digest)
+    elif isinstance(value, dict):
+        digest.update("dict{{{}".format(len(value)).encode())
+        for k, v in value.items():
+            _feed_data(k, digest)
+            _feed_data(v, digest)
+    else:
+        digest.update("{}:{!r};".format(type(value).__name__, value).encode())
+
+
+def _code_digest(code):
+    # bytecode, constants and names of a code object and every code object nested in it
+    cached = _code_digests.get(code)
+    if cached is None:
+        digest = hashlib.sha256()
+        digest.update(code.co_code)
+        digest.update(repr(code.co_names).encode())
+        digest.update(repr(code.co_freevars).encode())
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                digest.update(_code_digest(const).encode())
+            else:
+                digest.update(repr(const).encode())
+        cached = _code_digests[code] = digest.hexdigest()
+    return cached
+
+
+def _global_names(code):
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.extend(_global_names(const))
+    return names
+
+
+def _source_digest(module):
+    # only modules of this project are hashed, installed libraries are taken as they are
+    filename = getattr(module, "__file__", None)
+    if filename is None or not os.path.abspath(filename).startswith(_src_dir):
+        return None
+    cached = _source_digests.get(filename)
+    if cached is None:
+        with open(filename, "rb") as fid:
+            cached = _source_digests[filename] = hashlib.sha256(fid.read()).hexdigest()
+    return cached
+
+
+def _in_project(module_name):
+    return _source_digest(sys.modules.get(module_name)) is not None
+
+
+def _feed_function(func, digest, seen):
+    code = func.__code__
+    digest.update(_code_digest(code).encode())
+    for default in (func.__defaults__ or ()):
+        _feed(default, digest, seen)
+
+    if func.__closure__:
+        for name, cell in zip(code.co_freevars, func.__closure__):
+            try:
+                value = cell.cell_contents
+            except ValueError:
+                continue
+            if name in _ignored:
+                continue
+            _feed_name(name, digest)
+            _feed(value, digest, seen)
+
+    # underscore-private module state (caches, counters) is not an input of any stage
+    namespace = func.__globals__
+    for name in _global_names(code):
+        if name in namespace and not name.startswith("_") and name not in _ignored:
+            _feed_name(name, digest)
+            _feed(namespace[name], digest, seen)
+
+
+def _feed_class(cls, digest, seen):
+    for klass in cls.__mro__:
+        if klass is object:
+            continue
+        digest.update(klass.__qualname__.encode())
+        for name, value in vars(klass).items():
+            if isinstance(value, (staticmethod, classmethod)):
+                value = value.__func__
+            if isinstance(value, types.FunctionType) or _is_data(value):
+                digest.update(name.encode())
+                _feed(value, digest, seen)
+
+
+def _feed(obj, digest, seen):
+    if _is_data(obj):
+        _feed_data(obj, digest)
+        return
+
+    if id(obj) in seen:
+        digest.update(b"seen;")
+        return
+    seen.add(id(obj))
+
+    if isinstance(obj, types.FunctionType):
+        if _in_project(obj.__module__):
+            _feed_function(obj, digest, seen)
+        else:
+            digest.update("function:{}.{};".format(obj.__module__, obj.__qualname__).encode())
+    elif isinstance(obj, types.MethodType):
+        _feed(obj.__func__, digest, seen)
+        _feed(obj.__self__, digest, seen)
+    elif isinstance(obj, types.ModuleType):
+        source = _source_digest(obj)
+        digest.update("module:{}:{};".format(obj.__name__, source).encode())
+    elif isinstance(obj, type):
+        if _in_project(obj.__module__):
+            _feed_class(obj, digest, seen)
+        else:
+            digest.update("class:{}.{};".format(obj.__module__, obj.__qualname__).encode())
+    elif isinstance(obj, (list, tuple)):
+        # a sequence holding more than data, such as the inputs of a stage: item by item
+        digest.update("{}[{}".format(type(obj).__name__, len(obj)).encode())
+        for item in obj:
+            _feed(item, digest, seen)
+    elif isinstance(obj, dict):
+        digest.update(b"table;")  # memo tables and other runtime state
+    elif hasattr(obj, "__dict__") and _in_project(type(obj).__module__):
+        # objects of project classes, such as the clusters: their settings and their methods
+        _feed(type(obj), digest, seen)
+        for name, value in vars(obj).items():
+            if _is_data(value):
+                digest.update(name.encode())
+                _feed_data(value, digest)
+    else:
+        digest.update("object:{};".format(type(obj).__qualname__).encode())
@@ -0,0 +1,67 @@
+import builtins
+import sys
+import time
+
+# Where the time goes before a build starts.
+#
+#   python src/dactyl_manuform.py --startup-profile
+#
+# prints how long each startup phase of make_dactyl() took and which top level packages
+# were imported, with their import times, then stops before building anything.  Nested
+# imports count towards the package that pulled them in.
+
+_enabled = False
+_start = time.perf_counter()
+_last = _start
+_phases = []
+_imports = {}
+_depth = 0
+
+
+def enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled, _start, _last
+    if _enabled:
+        return
+    _enabled = True
+    _start = _last = time.perf_counter()
+    original = builtins.__import__
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        global _depth
+        top = name.partition(".")[0]
+        if level != 0 or _depth > 0 or top in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        _depth += 1
+        start = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            _depth -= 1
+            _imports[top] = _imports.get(top, 0.0) + time.perf_counter() - start
+
+    builtins.__import__ = timed_import
+
+
+def mark(phase):
+    # the time since the previous mark is charged to phase
+    global _last
+    if _enabled:
+        now = time.perf_counter()
+        _phases.append((phase, now - _last))
+        _last = now
+
+
+def report(top=15):
+    print()
+    print("STARTUP PROFILE")
+    for phase, seconds in _phases:
+        print("{:>9.3f}s  {}".format(seconds, phase))
+    print("{:>9.3f}s  total".format(_last - _start))
+    print()
+    print("Slowest imports:")
+    for name, seconds in sorted(_imports.items(), key=lambda item: -item[1])[:top]:
+        print("{:>9.3f}s  {}".format(seconds, name))
@@ -34,7 +34,7 @@ def gen_holder():
     base_shape = union([plate, cyl1, cyl2])
 
     # Ball with 2mm space extra diameter for socket
-    ball = translate(rotate(get_ball(True), (180, 0, 0)), (0, 0, 15))
+    ball = place(get_ball(True), (180, 0, 0), (0, 0, 15))
 
     # Screw holes with a bit of extra height to subtract cleanly
     # May need to be offset by one, as per the bottom hole...?
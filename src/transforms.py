@@ -0,0 +1,68 @@
+import numpy as np
+
+
+# 4x4 homogeneous transforms shared by the geometry engines and the placement code.
+# Angles are in radians unless the function name says otherwise.
+
+def identity():
+    return np.identity(4)
+
+
+def translation(xyz):
+    matrix = np.identity(4)
+    matrix[:3, 3] = xyz[:3]
+    return matrix
+
+
+def rotation_x(angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([
+        [1, 0, 0, 0],
+        [0, c, -s, 0],
+        [0, s, c, 0],
+        [0, 0, 0, 1],
+    ])
+
+
+def rotation_y(angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([
+        [c, 0, s, 0],
+        [0, 1, 0, 0],
+        [-s, 0, c, 0],
+        [0, 0, 0, 1],
+    ])
+
+
+def rotation_z(angle):
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([
+        [c, -s, 0, 0],
+        [s, c, 0, 0],
+        [0, 0, 1, 0],
+        [0, 0, 0, 1],
+    ])
+
+
+def rotation_degrees(angles):
+    # Same order as the engines' rotate(): about X, then Y, then Z, all around the origin.
+    angles = np.radians(angles)
+    return rotation_z(angles[2]) @ rotation_y(angles[1]) @ rotation_x(angles[0])
+
+
+def translate_matrix(matrix, xyz):
+    return translation(xyz) @ matrix
+
+
+def rotate_x_matrix(matrix, angle):
+    return rotation_x(angle) @ matrix
+
+
+def rotate_y_matrix(matrix, angle):
+    return rotation_y(angle) @ matrix
+
+
+def apply(matrix, points):
+    # Transform an (N, 3) batch of points in one matmul.
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]